@@ -0,0 +1,176 @@
+"""Benchmark offline dos resolvedores de captcha.
+
+Reexecuta um corpus de captchas rotulados (o texto no início do nome do
+arquivo, como em SIGISS_AMOSTRAS_CAPTCHA/rotulados/) em cada resolvedor e
+configuração de limiares, sem abrir o portal, e mede:
+
+- acerto na primeira tentativa;
+- média de tentativas até o login passar, simulando o loop de login
+  (cada tentativa recebe o próximo captcha do corpus, no máximo 10);
+- tempo de resolução p50/p95 e o tempo estimado de um login.
+
+Uso:
+    python benchmarks/captcha_bench.py <pasta_corpus> [modelo_glifos.npz] [--json saida.json]
+
+Sem modelo de glifos, metade do corpus treina o classificador e todos os
+resolvedores são medidos na outra metade.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sigiss.captcha import LIMIARES, ResolvedorCaptcha, preprocessar_captcha, tesserocr
+from sigiss.glifos import ClassificadorGlifos, amostras_rotuladas
+
+# Mesmo limite do loop de login dos bots
+MAX_TENTATIVAS = 10
+
+# Custo aproximado, em segundos, de cada desfecho no loop de login:
+# texto inválido só recarrega a imagem; toda submissão espera 1s + 3s pelo portal
+CUSTO_INVALIDA = 1.0
+CUSTO_SUBMISSAO = 4.0
+
+SEMENTE = 42
+
+
+def tesseract_disponivel():
+    if tesserocr is not None:
+        return True
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def resolvedores(modelo):
+    """Nome -> função(img) de cada resolvedor/configuração a comparar"""
+    candidatos = {}
+
+    if tesseract_disponivel():
+        ocr = ResolvedorCaptcha(estrategia='tesseract')
+        candidatos['tesseract_limiar_140'] = lambda img: ocr.ler(preprocessar_captcha(img))
+        for nome, limiares in [
+            ('votacao_3_limiares', (125, 140, 155)),
+            (f'votacao_{len(LIMIARES)}_limiares', LIMIARES),
+            ('votacao_9_limiares', tuple(range(100, 181, 10))),
+        ]:
+            candidatos[nome] = ResolvedorCaptcha(limiares=limiares, estrategia='tesseract').resolver
+    else:
+        print("⚠️ tesseract não encontrado, resolvedores de OCR ignorados")
+
+    if modelo:
+        candidatos['glifos'] = ResolvedorCaptcha(estrategia='glifos', modelo=modelo).resolver
+        if tesseract_disponivel():
+            candidatos['auto'] = ResolvedorCaptcha(estrategia='auto', modelo=modelo).resolver
+
+    return candidatos
+
+
+def medir(resolver, corpus):
+    """Roda o resolvedor em cada captcha do corpus e simula o loop de login"""
+    leituras = []
+    for img, rotulo in corpus:
+        inicio = time.perf_counter()
+        texto = resolver(img)
+        leituras.append((texto, rotulo, time.perf_counter() - inicio))
+
+    acertos = [texto == rotulo for texto, rotulo, _ in leituras]
+    tempos = np.array([t for _, _, t in leituras])
+
+    # Loop de login: cada tentativa consome o próximo captcha, em ordem embaralhada
+    ordem = list(range(len(leituras)))
+    random.Random(SEMENTE).shuffle(ordem)
+    tentativas_por_login, segundos_por_login, logins_falhos = [], [], 0
+    tentativas, segundos = 0, 0.0
+    for i in ordem:
+        texto, rotulo, tempo = leituras[i]
+        tentativas += 1
+        segundos += tempo + (CUSTO_SUBMISSAO if len(texto) == len(rotulo) and texto.isalnum() else CUSTO_INVALIDA)
+        if texto == rotulo:
+            tentativas_por_login.append(tentativas)
+            segundos_por_login.append(segundos)
+            tentativas, segundos = 0, 0.0
+        elif tentativas == MAX_TENTATIVAS:
+            logins_falhos += 1
+            tentativas, segundos = 0, 0.0
+
+    return {
+        'amostras': len(leituras),
+        'acerto_primeira': round(sum(acertos) / len(acertos), 3),
+        'tentativas_media': round(float(np.mean(tentativas_por_login)), 2) if tentativas_por_login else None,
+        'logins_falhos': logins_falhos,
+        'segundos_por_login': round(float(np.mean(segundos_por_login)), 2) if segundos_por_login else None,
+        'p50_ms': round(float(np.percentile(tempos, 50)) * 1000, 2),
+        'p95_ms': round(float(np.percentile(tempos, 95)) * 1000, 2),
+    }
+
+
+def carregar_corpus(pasta):
+    corpus = []
+    for caminho, rotulo in amostras_rotuladas(pasta):
+        with Image.open(caminho) as img:
+            img.load()
+            corpus.append((img, rotulo))
+    return corpus
+
+
+def main():
+    args = sys.argv[1:]
+    saida_json = None
+    if '--json' in args:
+        i = args.index('--json')
+        saida_json = args[i + 1]
+        del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    corpus = carregar_corpus(args[0])
+    if not corpus:
+        print(f"❌ Nenhum captcha rotulado em {args[0]}")
+        sys.exit(1)
+
+    modelo = args[1] if len(args) > 1 else None
+    temporario = None
+    if modelo is None and len(corpus) >= 2:
+        # Sem modelo pronto: treina com metade do corpus e mede na outra metade
+        random.Random(SEMENTE).shuffle(corpus)
+        metade = len(corpus) // 2
+        treino, corpus = corpus[:metade], corpus[metade:]
+        with tempfile.TemporaryDirectory() as pasta_treino:
+            for i, (img, rotulo) in enumerate(treino):
+                img.save(os.path.join(pasta_treino, f"{rotulo}_{i}.png"))
+            classificador = ClassificadorGlifos.treinar(pasta_treino)
+        temporario = tempfile.NamedTemporaryFile(suffix='.npz', delete=False)
+        temporario.close()
+        classificador.salvar(temporario.name)
+        modelo = temporario.name
+        print(f"Classificador treinado com {len(treino)} captchas, medindo em {len(corpus)}")
+
+    try:
+        resultados = {nome: medir(resolver, corpus) for nome, resolver in resolvedores(modelo).items()}
+    finally:
+        if temporario:
+            os.unlink(temporario.name)
+
+    colunas = ['acerto_primeira', 'tentativas_media', 'logins_falhos', 'segundos_por_login', 'p50_ms', 'p95_ms']
+    print(f"{'resolvedor':<24}" + ''.join(f"{c:>20}" for c in colunas))
+    for nome, r in resultados.items():
+        print(f"{nome:<24}" + ''.join(f"{str(r[c]):>20}" for c in colunas))
+
+    if saida_json:
+        with open(saida_json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""Benchmark de ponta a ponta: encerramentos por hora x quantidade de workers.
+
+Sobe o simulador do portal (simulador/portal.py) e, para cada quantidade de
+workers da varredura, um server.py novo (SIGISS_WORKERS e SIGISS_CONCORRENCIA)
+numa pasta temporária, com banco e sessões próprios. Envia um lote sintético
+de CNPJs da carteira simulada via POST /encerrar, acompanha cada job por
+GET /jobs/<id> e mede:
+
+- jobs por hora (lote inteiro, do primeiro POST ao último job terminado),
+  contando só os encerramentos (concluido/com_falhas);
+- taxa de erro (jobs em 'erro' ou sem resposta até o teto);
+- latência por job encerrado (p50/p95/máximo, do POST ao fim do job);
+- CPU e RSS do servidor somados aos navegadores que ele abriu (médio e máximo).
+
+Uso:
+    python benchmarks/throughput_bench.py [--workers 1,2,4,8] [--jobs 20] [--periodos 012024-062024]
+        [--latencia 150] [--jitter 100] [--erro 0] [--motor threads] [--json saida.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+import requests
+from playwright.sync_api import sync_playwright
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from sigiss.captcha import ESTRATEGIA, MODELO_GLIFOS
+from sigiss.cronometro import percentil
+from sigiss.db import criar_tabela_empresas
+
+URL_SERVIDOR = "http://127.0.0.1:5000"
+STATUS_FINAIS = {'concluido', 'com_falhas', 'erro'}
+# Jobs que chegaram ao fim do encerramento (com_falhas: algum mês falhou, os outros foram encerrados)
+STATUS_ENCERRADOS = {'concluido', 'com_falhas'}
+INTERVALO_CONSULTA = 0.5
+INTERVALO_AMOSTRA = 1.0
+
+
+def verificar_ambiente():
+    """Sem o Chromium do Playwright ou sem OCR para o captcha todo job termina
+    em 'erro' e a varredura mede só falhas: confere antes de subir o simulador"""
+    faltando = []
+    with sync_playwright() as playwright:
+        executavel = playwright.chromium.executable_path
+    if not os.path.exists(executavel):
+        faltando.append(f"Chromium do Playwright ({executavel}): python -m playwright install chromium")
+    if ESTRATEGIA == 'glifos':
+        if not os.path.exists(MODELO_GLIFOS):
+            faltando.append(f"modelo de glifos do captcha ({MODELO_GLIFOS})")
+    elif not shutil.which('tesseract'):
+        faltando.append("tesseract (OCR do captcha) no PATH, ou SIGISS_CAPTCHA_SOLVER=glifos com um modelo treinado")
+    if faltando:
+        raise SystemExit("❌ Ambiente incompleto para o benchmark:\n  - " + "\n  - ".join(faltando))
+
+
+def esperar_url(url, teto=60):
+    """Espera o serviço responder (200) em `url`"""
+    limite = time.time() + teto
+    while time.time() < limite:
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} não respondeu em {teto}s")
+
+
+def encerrar_processo(processo):
+    """Termina o processo e os filhos (navegadores do pool)"""
+    try:
+        arvore = psutil.Process(processo.pid)
+        filhos = arvore.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return
+    for p in [arvore] + filhos:
+        try:
+            p.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, vivos = psutil.wait_procs([arvore] + filhos, timeout=10)
+    for p in vivos:
+        p.kill()
+
+
+class Amostrador(threading.Thread):
+    """Amostra CPU (%) e RSS (MB) do servidor e dos processos filhos a cada segundo"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.raiz = psutil.Process(pid)
+        self.parar = threading.Event()
+        self.cpu, self.rss = [], []
+        self._processos = {}
+
+    def _arvore(self):
+        try:
+            atuais = [self.raiz] + self.raiz.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+        for p in atuais:
+            if p.pid not in self._processos:
+                self._processos[p.pid] = p
+                p.cpu_percent(None)  # primeira leitura só arma o contador
+        return [self._processos[p.pid] for p in atuais]
+
+    def run(self):
+        self._arvore()
+        while not self.parar.wait(INTERVALO_AMOSTRA):
+            cpu, rss = 0.0, 0
+            for p in self._arvore():
+                try:
+                    cpu += p.cpu_percent(None)
+                    rss += p.memory_info().rss
+                except psutil.NoSuchProcess:
+                    continue
+            self.cpu.append(cpu)
+            self.rss.append(rss / 1024 / 1024)
+
+    def resumo(self):
+        if not self.cpu:
+            return {'cpu_medio_pct': None, 'cpu_max_pct': None, 'rss_medio_mb': None, 'rss_max_mb': None}
+        return {
+            'cpu_medio_pct': round(sum(self.cpu) / len(self.cpu), 1),
+            'cpu_max_pct': round(max(self.cpu), 1),
+            'rss_medio_mb': round(sum(self.rss) / len(self.rss), 1),
+            'rss_max_mb': round(max(self.rss), 1),
+        }
+
+
+def iniciar_simulador(args):
+    comando = [
+        sys.executable, os.path.join(RAIZ, 'simulador', 'portal.py'), '--porta', str(args.porta_portal),
+        '--latencia', str(args.latencia), '--jitter', str(args.jitter), '--erro', str(args.erro),
+        '--clientes', str(max(args.jobs, 120)),
+    ]
+    processo = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.porta_portal}"
+    esperar_url(f"{url}/simulador/estatisticas")
+    return processo, url
+
+
+def iniciar_servidor(workers, args, url_portal, pasta, log):
+    """server.py numa pasta própria: banco, sessões e diagnósticos não se misturam entre rodadas"""
+    try:
+        requests.get(f"{URL_SERVIDOR}/pool", timeout=2)
+        raise RuntimeError(f"Já existe um servidor em {URL_SERVIDOR}; pare-o antes do benchmark")
+    except requests.ConnectionError:
+        pass
+
+    with sqlite3.connect(os.path.join(pasta, 'empresas.db')) as conn:
+        criar_tabela_empresas(conn)
+    env = dict(
+        os.environ,
+        SIGISS_BASE_URL=f"{url_portal}/acailandia/",
+        SIGISS_WORKERS=str(workers),
+        SIGISS_CONCORRENCIA=str(workers),
+        SIGISS_MOTOR=args.motor,
+        SIGISS_FATOR_ESPERA_RETRY='0.1',
+        PYTHONPATH=RAIZ,
+    )
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, 'server.py')], cwd=pasta, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    esperar_url(f"{URL_SERVIDOR}/pool")
+    return processo
+
+
+def rodar_lote(cnpjs, args):
+    """Envia o lote e acompanha até o fim. Retorna (duração, [(status, latência)])"""
+    periodo_inicial, periodo_final = args.periodos.split('-')
+    enviados = {}
+    inicio = time.perf_counter()
+    for cnpj in cnpjs:
+        resposta = requests.post(f"{URL_SERVIDOR}/encerrar", json={
+            'bot_path': args.bot, 'cnpj': cnpj,
+            'periodo_inicial': periodo_inicial, 'periodo_final': periodo_final,
+        }, timeout=30)
+        resposta.raise_for_status()
+        enviados[resposta.json()['job_id']] = time.perf_counter()
+
+    resultados = {}
+    limite = time.perf_counter() + args.teto
+    while len(resultados) < len(enviados) and time.perf_counter() < limite:
+        time.sleep(INTERVALO_CONSULTA)
+        for job_id, enviado_em in enviados.items():
+            if job_id in resultados:
+                continue
+            status = requests.get(f"{URL_SERVIDOR}/jobs/{job_id}", timeout=10).json().get('status')
+            if status in STATUS_FINAIS:
+                resultados[job_id] = (status, time.perf_counter() - enviado_em)
+
+    for job_id in enviados:
+        resultados.setdefault(job_id, ('sem_resposta', None))
+    return time.perf_counter() - inicio, list(resultados.values())
+
+
+def medir(workers, args, url_portal):
+    requests.post(f"{url_portal}/simulador/reiniciar", timeout=10)
+    cnpjs = requests.get(f"{url_portal}/simulador/clientes", timeout=10).json()[:args.jobs]
+
+    pasta = tempfile.mkdtemp(prefix=f"bench_{workers}w_")
+    with open(os.path.join(pasta, 'server.log'), 'w', encoding='utf-8') as log:
+        servidor = iniciar_servidor(workers, args, url_portal, pasta, log)
+        amostrador = Amostrador(servidor.pid)
+        amostrador.start()
+        try:
+            duracao, resultados = rodar_lote(cnpjs, args)
+        finally:
+            amostrador.parar.set()
+            amostrador.join()
+            encerrar_processo(servidor)
+
+    # Vazão e latência só dos encerramentos: um job que cai rápido em 'erro' não conta
+    latencias = sorted(lat for status, lat in resultados if status in STATUS_ENCERRADOS)
+    contagem = {}
+    for status, _ in resultados:
+        contagem[status] = contagem.get(status, 0) + 1
+    terminados = len(latencias)
+    falhos = len(resultados) - terminados
+
+    medida = {
+        'workers': workers,
+        'jobs': len(cnpjs),
+        'status': contagem,
+        'duracao_s': round(duracao, 1),
+        'jobs_por_hora': round(terminados / duracao * 3600, 1) if duracao else None,
+        'taxa_erro_pct': round(falhos / len(resultados) * 100, 1) if resultados else None,
+        'latencia_p50_s': round(percentil(latencias, 50), 1) if latencias else None,
+        'latencia_p95_s': round(percentil(latencias, 95), 1) if latencias else None,
+        'latencia_max_s': round(latencias[-1], 1) if latencias else None,
+    }
+    medida.update(amostrador.resumo())
+    if args.manter:
+        medida['pasta'] = pasta
+    else:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return medida
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encerramentos por hora x quantidade de workers contra o simulador")
+    parser.add_argument('--workers', default='1,2,4,8', help="Varredura de workers, separados por vírgula")
+    parser.add_argument('--jobs', type=int, default=20, help="CNPJs no lote de cada rodada")
+    parser.add_argument('--periodos', default='012024-062024', help="Intervalo MMAAAA-MMAAAA de cada job")
+    parser.add_argument('--bot', default='bot.py', help="Bot de encerramento (bots/<bot>)")
+    parser.add_argument('--motor', choices=['threads', 'async'], default='threads')
+    parser.add_argument('--latencia', type=int, default=150, help="Latência do simulador (ms)")
+    parser.add_argument('--jitter', type=int, default=100, help="Latência extra aleatória do simulador (ms)")
+    parser.add_argument('--erro', type=float, default=0.0, help="Taxa de erro 500 injetada no simulador")
+    parser.add_argument('--porta-portal', type=int, default=8085)
+    parser.add_argument('--teto', type=int, default=3600, help="Tempo máximo de cada rodada (s)")
+    parser.add_argument('--manter', action='store_true', help="Mantém a pasta de cada rodada (server.log, banco)")
+    parser.add_argument('--json', dest='saida_json', help="Grava as medidas em JSON")
+    args = parser.parse_args()
+
+    verificar_ambiente()
+    simulador, url_portal = iniciar_simulador(args)
+    medidas = []
+    try:
+        for workers in [int(w) for w in args.workers.split(',')]:
+            print(f"⏱️ {workers} worker(s), {args.jobs} jobs, períodos {args.periodos}...")
+            medidas.append(medir(workers, args, url_portal))
+    finally:
+        encerrar_processo(simulador)
+
+    colunas = ['jobs_por_hora', 'taxa_erro_pct', 'latencia_p50_s', 'latencia_p95_s', 'latencia_max_s',
+               'cpu_medio_pct', 'cpu_max_pct', 'rss_medio_mb', 'rss_max_mb']
+    print(f"{'workers':<9}" + ''.join(f"{c:>16}" for c in colunas) + "  status")
+    for m in medidas:
+        print(f"{m['workers']:<9}" + ''.join(f"{str(m[c]):>16}" for c in colunas) + f"  {m['status']}")
+
+    if args.saida_json:
+        with open(args.saida_json, 'w', encoding='utf-8') as f:
+            json.dump(medidas, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
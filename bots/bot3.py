@@ -1,17 +1,20 @@
+import os
 import time
 import logging
-import re
-import sqlite3
-import json
 import sys
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from playwright.sync_api import sync_playwright, expect
+from playwright.sync_api import sync_playwright
 import requests
 import asyncio
-import websockets
-import pytesseract
-from PIL import Image
+
+# Permite importar o pacote sigiss quando o bot roda como script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sigiss.alertas import enviar_alerta
+from sigiss.carteira import pesquisar_cliente, sincronizar_carteira
+from sigiss.db import atualizar_status_db, salvar_notas
+from sigiss.login import entrar
+from sigiss.notas import SELETOR_NOTAS, extrair_notas
+from sigiss.perfil import contexto_avulso
+from sigiss.periodos import gerar_periodos
 
 ########## bot para buscar histórico de notas por periodo ###################
 
@@ -21,23 +24,6 @@ logging.basicConfig(level=logging.INFO,
                    encoding='utf-8')
 logger = logging.getLogger('bot')
 
-# Função para enviar alertas via WebSocket
-async def enviar_alerta(cnpj, status):
-    """Envia alertas via WebSocket para o servidor principal"""
-    try:
-        # Conecta ao servidor WebSocket na porta 5000 (mesma do Flask)
-        async with websockets.connect('ws://localhost:5000') as websocket:
-            await websocket.send(json.dumps({
-                "tipo": "encerramento_concluido",
-                "cnpj": cnpj,
-                "status": status,
-                "timestamp": datetime.now().isoformat()
-            }))
-    except Exception as e:
-        logger.error(f"Erro ao enviar alerta WebSocket: {e}")
-
-
-
 # Função principal chamada pelo servidor
 def main(cnpj, periodo_inicial, periodo_final, callback_status=None):
     """Função principal chamada pelo servidor"""
@@ -54,70 +40,13 @@ def main(cnpj, periodo_inicial, periodo_final, callback_status=None):
     with sync_playwright() as playwright:
         run(playwright, cnpj, periodo_inicial, periodo_final, callback_status)
 
-# Configuração do banco de dados
-def save_to_database(dados):
-    """Salva dados no banco SQLite com substituição de duplicados"""
-    try:
-        # Abrir conexão com o banco
-        with sqlite3.connect('empresas.db') as conn:
-            c = conn.cursor()
-            
-            # Verificar se as colunas existem
-            c.execute("PRAGMA table_info(empresas)")
-            colunas = [col[1] for col in c.fetchall()]
-            
-            # Criar a tabela se não existir
-            c.execute('''CREATE TABLE IF NOT EXISTS empresas (
-                im TEXT, 
-                cnpj TEXT UNIQUE,
-                nome TEXT, 
-                omisso TEXT, 
-                debito TEXT,
-                status TEXT DEFAULT 'pendente',
-                progresso TEXT DEFAULT '0'
-            )''')
-            
-            # Inserir os dados, substituindo os duplicados
-            c.executemany('INSERT OR REPLACE INTO empresas (im, cnpj, nome, omisso, debito) VALUES (?, ?, ?, ?, ?)', dados)
-            
-            # Commit para garantir a gravação dos dados
-            conn.commit()
-            logger.info(f"{len(dados)} registros salvos com sucesso no banco.")
-    
-    except sqlite3.Error as e:
-        logger.error(f"Erro ao salvar no banco de dados: {e}")
-
-# Atualização de status no banco de dados
-def atualizar_status_db(cnpj, status, progresso):
-    """Atualiza o status e progresso no banco de dados"""
-    try:
-        with sqlite3.connect('empresas.db') as conn:
-            c = conn.cursor()
-            c.execute('''
-                UPDATE empresas 
-                SET status = ?, progresso = ? 
-                WHERE cnpj = ?
-            ''', (status, progresso, cnpj))
-            conn.commit()
-    except sqlite3.Error as e:
-        logger.error(f"Erro ao atualizar status: {e}")
-
-# Geração de períodos
-def gerar_periodos(mes_inicio, ano_inicio, mes_fim, ano_fim):
-    """Gera lista de períodos no formato (MM, AAAA)"""
-    periodos = []
-    data_inicio = datetime(int(ano_inicio), int(mes_inicio), 1)
-    data_fim = datetime(int(ano_fim), int(mes_fim), 1)
-    
-    atual = data_inicio
-    while atual <= data_fim:
-        periodos.append((f"{atual.month:02d}", str(atual.year)))
-        atual += relativedelta(months=1)
-    return periodos
-
 # Função principal de encerramento
-def scraping (page, cnpj, periodo_inicial, periodo_final, callback_status=None):
-    """Executa o encerramento para um CNPJ e um intervalo de períodos"""
+def scraping (page, cnpj, periodo_inicial, periodo_final, callback_status=None, destino=None):
+    """Lê o histórico de notas de um CNPJ em cada período do intervalo.
+
+    As notas são entregues em lotes para `destino(cnpj, lote)`, por padrão a tabela notas.
+    """
+    destino = destino or salvar_notas
     try:       
 
         # Extrai mês e ano do periodo_inicial e periodo_final (formato MMAAAA)
@@ -141,48 +70,30 @@ def scraping (page, cnpj, periodo_inicial, periodo_final, callback_status=None):
                 
                 # Clica no botão historico movimento
                 page.get_by_role("button", name="Historico Emissões NF-e").click()
-                time.sleep(1)
+                page.wait_for_selector('select#mesI')
             
                 # Acessa o frame principal
                 main_frame = page.frame_locator('#main')
 
-                # Preenche período
-                # Selecionar mês e ano inicial
-                page.select_option('select#mesI', mes_inicial)
-                page.fill('input#anoI', ano_inicial)
-
-                # Selecionar mês e ano final
-                page.select_option('select#mesF', mes_final)
-                page.fill('input#anoF', ano_final)
+                # Preenche o período atual do loop (mês inicial = mês final)
+                page.select_option('select#mesI', mes)
+                page.fill('input#anoI', ano)
+                page.select_option('select#mesF', mes)
+                page.fill('input#anoF', ano)
 
                 # Clicar no botão Filtrar
                 page.click('input[type="submit"][value="Filtrar"]')
 
-                time.sleep(1)  # Espera para carregamento da página
-
-                # Aguarde a navegação ou resultado
-                #page.wait_for_load_state('networkidle')
-               
-                
                 # fazer scraping
                 # Aguarde a tabela carregar
-                page.wait_for_selector('table.bluecubeGrid tr.line')
+                page.wait_for_selector(SELETOR_NOTAS)
 
-                notas = []
-                linhas = page.query_selector_all('table.bluecubeGrid tr.line')
-                for linha in linhas:
-                    celulas = linha.query_selector_all('td.cell')
-                    if len(celulas) >= 9:
-                        notas.append({
-                            'numero_nota': celulas[0].inner_text().strip(),
-                            'emissao': celulas[1].inner_text().strip(),
-                            'competencia': celulas[2].inner_text().strip(),
-                            'tributacao': celulas[3].inner_text().strip(),
-                            'servico': celulas[4].inner_text().strip(),
-                            'valor': float(celulas[5].inner_text().replace('.', '').replace(',', '.').strip()),
-                            'tomador': celulas[6].inner_text().strip(),
-                            'status': celulas[7].inner_text().strip()
-                        })
+                # Cada página da grade vai direto para o destino, em lotes
+                total_notas = 0
+                for lote in extrair_notas(page):
+                    destino(cnpj, lote)
+                    total_notas += len(lote)
+                logger.info(f"{total_notas} notas em {mes}/{ano}")
 
                 # fechar janela historico
                 if total_periodos < len(periodo_final):
@@ -234,140 +145,30 @@ def scraping (page, cnpj, periodo_inicial, periodo_final, callback_status=None):
 
 
 # Fluxo principal
-def run(playwright, cnpj, periodo_inicial, periodo_final, callback_status=None):
-    browser = playwright.chromium.launch(headless=False)
-    context = browser.new_context()
+def run(playwright, cnpj, periodo_inicial, periodo_final, callback_status=None, context=None):
+    # Quando o servidor entrega um contexto do pool, o navegador já está aberto
+    if context is None:
+        with contexto_avulso(playwright) as context:
+            return run(playwright, cnpj, periodo_inicial, periodo_final, callback_status, context)
+
     page = context.new_page()
 
     try:
         if callback_status:
             callback_status('iniciando_login')
             
-        # Login
-        page.goto("https://acailandia.sigiss.com.br/acailandia/index.php")
-        expect(page).to_have_title(".:: PREFEITURA - Açailândia ::.")
-
-        # Acesso à área de contadores
-        page.get_by_role("row", name="Acesso para acompanhamento de declarações e gestão de contribuintes vinculados a contadores no município de Açailândia.", exact=True).get_by_role("link").click()
-        
-        # Preenchimento das credenciais
-        page.get_by_role("textbox", name="CRC do Contador").fill("012452")
-        page.get_by_role("textbox", name="******").fill("romario12")
-        
-        ################### OCRC ###############################
-        tentativas = 0
-        sucesso = False
-
-        while tentativas < 10:
-            tentativas += 1
-
-            # Espera a imagem aparecer e capturar
-            captcha_element = page.query_selector('div#div-img-captcha img')
-            captcha_element.screenshot(path="captcha.png")
+        # Login (reaproveita a sessão salva quando ainda está válida)
+        entrar(page, job=cnpj)
 
-            # abre a imagem e converte para preto e branco e aumenta o tamanho para o ocr
-            img = Image.open("captcha.png")
-            img = img.convert('L')
-            img = img.point(lambda x: 0 if x < 140 else 255, '1')
-
-            # ocr da imagem
-            texto_ocr = pytesseract.image_to_string(img).strip()
-            print(f"OCR capturado: '{texto_ocr}'")
-
-            # Validar o OCR (exemplo: captcha deve ter 6 caracteres alfanuméricos)
-            if len(texto_ocr) == 4 and texto_ocr.isalnum():
-                print("OCR válido, preenchendo campo...")
-                page.fill('#confirma', texto_ocr)
-                #page.get_by_role("button", name="  Login").click()
-
-                time.sleep(1)
-                # clicar no btn login
-                page.get_by_role("button", name="  Login").click()
-
-                # Espera um pouco para verificar se o login foi bem-sucedido
-                page.wait_for_timeout(3000)
-
-                # Verifica se ainda está na tela do captcha (indicando falha)
-                erro_captcha = page.query_selector("#mensagem-erro")  # ou outro seletor de erro, se existir
-                #erro_captcha = page.query_selector('//html/body/table/tbody/tr[2]/td/div/div/div/div/div/div/form/div[2]/div[4]/table/tbody/tr/td[1]')
-
-
-                if erro_captcha and erro_captcha.inner_text().strip() != "":
-                    print("Captcha incorreto, tentando novamente...")
-                    # Atualiza o captcha clicando no div (caso necessário)
-                    page.click("#div-img-captcha")
-                    page.wait_for_function(f"document.querySelector('div#div-img-captcha img').getAttribute('src') != '{src}'")
-                    continue
-                else:
-                    print("Login provavelmente bem-sucedido.")
-                    sucesso = True
-                    break
-            else:
-                img.save(f"captcha_tentativa_{tentativas}.png")
-                print("OCR inválido, atualizando captcha para tentar de novo...")
-                page.click("#div-img-captcha")  # atualiza a imagem clicando
-                page.wait_for_timeout(1000)  # espera recarregar
-
-        if not sucesso:
-            print("Não foi possível resolver o captcha após várias tentativas.")
-
-
-        ################### OCRC ###############################
-
-        if callback_status:
-            callback_status('extraindo_dados')
-
-        # Navegação para a carteira de clientes
-        page.get_by_role("button", name="Contribuinte").click()
-        page.get_by_role("link", name="Carteira de Clientes").click()
-
-        # Acesso ao frame principal e espera pela tabela
-        main_frame = page.frame_locator('#main')
-        
-               
-        # Espera pelo primeiro elemento da tabela com timeout maior
-        #main_frame.locator("tr.line").nth(0).wait_for(state='visible', timeout=60000)
-        main_frame.locator("tr.line").first.wait_for(state='visible', timeout=60000)
-
-        # Extração dos dados
-        rows = main_frame.locator("tr.line")
-        dados = []
-        
-        for i in range(rows.count()):
-            try:
-                row = rows.nth(i)
-                cells = row.locator("td")
-                
-                if cells.count() >= 5:
-                    im = cells.nth(0).inner_text().strip().replace('\xa0', '')
-                    cnpj_empresa = cells.nth(1).inner_text().strip().replace('\xa0', '')
-                    nome = cells.nth(2).inner_text().strip().replace('\xa0', '')
-                    omisso = cells.nth(3).inner_text().strip().replace('\xa0', '')
-                    debito = cells.nth(4).inner_text().strip().replace('\xa0', '')
-                    
-                    dados.append((im, cnpj_empresa, nome, omisso, debito))
-                else:
-                    logger.warning(f"Linha {i+1} não tem o número esperado de células.")
-            except Exception as e:
-                logger.error(f"Erro ao processar a linha {i+1}: {e}")
-                continue
-
-        # Salvar no banco de dados
-        save_to_database(dados)
-        logger.info(f"Dados salvos: {len(dados)} registros")
+        # Navegação para a carteira de clientes e extração dos dados
+        # (só quando a carteira gravada já passou do SIGISS_CARTEIRA_TTL)
+        sincronizar_carteira(page, callback_status)
 
         if callback_status:
             callback_status('iniciando_encerramento')
 
-        # Processo de encerramento
-        main_frame = page.frame_locator('#main')
-        
-        
-        # input cnpj da empresa para fazer o encerramento
-        # Processo de encerramento
-        main_frame.locator("#cnpj").fill(cnpj)  # Agora o CNPJ vem da variável cnpj
-        main_frame.get_by_role("button", name="Pesquisar").click()
-        main_frame.locator(f"td.cell.center:has-text('{cnpj}')").click()  # Usando o cnpj na busca
+        # Pesquisa o CNPJ na carteira
+        pesquisar_cliente(page, cnpj)
 
 
         scraping (page, cnpj, periodo_inicial, periodo_final, callback_status=None)     
@@ -380,9 +181,7 @@ def run(playwright, cnpj, periodo_inicial, periodo_final, callback_status=None):
             callback_status('erro')
         raise
     finally:
-        time.sleep(3)
-        context.close()
-        browser.close()
+        page.close()
 
 if __name__ == '__main__':
     # Configurar saída para UTF-8
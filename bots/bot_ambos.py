@@ -0,0 +1,57 @@
+import os
+import json
+import sys
+from playwright.sync_api import sync_playwright
+
+# Permite importar o pacote sigiss quando o bot roda como script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bots import bot
+
+########## bot de encerramento dos dois livros (prestado.php e tomado.php) ##########
+# Mesmo fluxo do bot.py, mas cada competência é selecionada uma vez e os
+# livros de Serviços Prestados e Tomados são encerrados em sequência nela.
+
+LIVRO = 'ambos'
+
+logger = bot.logger
+
+
+def main(cnpj, periodo_inicial, periodo_final, callback_status=None):
+    """Função principal chamada pelo servidor"""
+    periodo_inicial = periodo_inicial.replace('/', '')
+    periodo_final = periodo_final.replace('/', '')
+
+    with sync_playwright() as playwright:
+        return run(playwright, cnpj, periodo_inicial, periodo_final, callback_status)
+
+
+def run(playwright, cnpj, periodo_inicial, periodo_final, callback_status=None, context=None):
+    return bot.run(playwright, cnpj, periodo_inicial, periodo_final, callback_status, context, livro=LIVRO)
+
+
+def run_lote(playwright, itens, callback_status=None, context=None):
+    return bot.run_lote(playwright, itens, callback_status, context, livro=LIVRO)
+
+
+if __name__ == '__main__':
+    # Configurar saída para UTF-8
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    if len(sys.argv) > 2 and sys.argv[1] == '--lote':
+        with open(sys.argv[2], 'r', encoding='utf-8') as f:
+            itens = json.load(f)
+
+        with sync_playwright() as playwright:
+            resultados = run_lote(playwright, itens)
+
+        print(json.dumps(resultados, ensure_ascii=False, indent=2))
+
+    elif len(sys.argv) > 3:
+        with sync_playwright() as playwright:
+            resumo = run(playwright, sys.argv[1], sys.argv[2], sys.argv[3])
+
+        print(json.dumps(resumo['livros'], ensure_ascii=False, indent=2))
+    else:
+        logger.error("Faltando parâmetros para execução!")
+        print("Uso: python bot_ambos.py <cnpj> <periodo_inicial> <periodo_final>")
+        print("     python bot_ambos.py --lote <itens.json>")
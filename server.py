@@ -1,23 +1,41 @@
 import os
 import re
 import logging
+import importlib
 import requests
 import sqlite3
-import subprocess
 import traceback
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, render_template_string, request, jsonify, send_from_directory
 from flask_socketio import SocketIO, emit
 from functools import wraps
+from sigiss.captcha import resolvedor
+from sigiss.cronometro import resumir
+from sigiss.db import abrir_job, duracoes_passos, finalizar_job, jobs_interrompidos, obter_job, registrar_etapa
+from sigiss.diagnostico import artefatos, diagnosticar, pasta_job
+from sigiss.encerramento import livros_do_modo
+from sigiss.login import carregar_sessao, descartar_sessoes, opcoes_contexto
+from sigiss.motor_async import MotorAsync
+from sigiss.pool import BrowserPool
+from sigiss.sigiss import SigissPage
 
 # Configurações iniciais
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'segredo_super_secreto')
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-# Pool de threads para execução assíncrona
-executor = ThreadPoolExecutor(max_workers=5)
+# Motor de execução do encerramento: 'async' (vários contextos num só navegador)
+# ou 'threads' (um bot por thread do executor)
+MOTOR = os.environ.get('SIGISS_MOTOR', 'async')
+motor = MotorAsync()
+
+# Pool de threads para os bots síncronos (lotes, histórico de notas, motor 'threads')
+WORKERS = int(os.environ.get('SIGISS_WORKERS', '5'))
+executor = ThreadPoolExecutor(max_workers=WORKERS)
+
+# Navegadores aquecidos compartilhados entre os jobs (um por thread do executor)
+pool = BrowserPool()
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -38,8 +56,8 @@ def notificar_conclusao(cnpj, status, progresso):
             "http://localhost:5000/encerramento_concluido",
             json={
                 "cnpj": cnpj,
-                "status": "concluido",
-                "progresso": "100"
+                "status": status,
+                "progresso": progresso
             }
         )
         if response.status_code != 200:
@@ -87,6 +105,21 @@ def atualizar_status(conn, cnpj, status, progresso='0'):
         WHERE cnpj = ?
     ''', (status, progresso, cnpj))
 
+# Bots que podem ser importados e executados dentro do servidor (precisam de run(..., context=...))
+BOTS_PERMITIDOS = ('bot.py', 'bot2.py', 'bot3.py', 'bot_ambos.py')
+
+def resolver_bot_path(bot_path):
+    """Caminho absoluto seguro para o bot. Retorna (caminho, mensagem de erro)"""
+    if bot_path not in BOTS_PERMITIDOS:
+        return None, 'Bot não permitido'
+    bot_path_absoluto = os.path.abspath(os.path.join(os.path.dirname(__file__), 'bots', bot_path))
+    bots_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'bots'))
+    if not bot_path_absoluto.startswith(bots_dir):
+        return None, 'Caminho do bot inválido'
+    if not os.path.exists(bot_path_absoluto):
+        return None, 'Bot selecionado não encontrado'
+    return bot_path_absoluto, None
+
 @app.route('/encerramento_concluido', methods=['POST'])
 def encerramento_concluido():
     try:
@@ -134,25 +167,111 @@ def iniciar_encerramento():
         if not all(validar_periodo(p) for p in (periodo_inicial, periodo_final)):
             return jsonify({'error': 'Período inválido. Use MMAAAA'}), 400
 
-        # Caminho absoluto seguro para o bot
-        bot_path_absoluto = os.path.abspath(os.path.join(os.path.dirname(__file__), 'bots', bot_path))
-        bots_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'bots'))
-        if not bot_path_absoluto.startswith(bots_dir):
-            return jsonify({'error': 'Caminho do bot inválido'}), 400
-        if not os.path.exists(bot_path_absoluto):
-            return jsonify({'error': 'Bot selecionado não encontrado'}), 400
+        bot_path_absoluto, erro = resolver_bot_path(bot_path)
+        if erro:
+            return jsonify({'error': erro}), 400
+
+        # Diagnóstico opcional: trace do Playwright e/ou cProfile (artefatos em /jobs/<id>/artefatos)
+        diagnostico = {
+            'rastrear': bool(dados.get('rastrear')),
+            'perfilar': bool(dados.get('perfilar')),
+        }
+
+        livro = getattr(carregar_bot(bot_path_absoluto), 'LIVRO', None)
+
+        # Diário do job: um job igual que terminou com erro é retomado do ponto onde parou;
+        # um que ainda está rodando não é submetido de novo
+        job_id, ja_em_andamento = abrir_job(cnpj, os.path.basename(bot_path_absoluto), livro,
+                                            periodo_inicial, periodo_final)
+        if ja_em_andamento:
+            return jsonify({
+                'error': 'Já existe um job igual em andamento',
+                'cnpj': cnpj,
+                'job_id': job_id,
+                'status': 'em_processo',
+            }), 409
 
         atualizar_status(cnpj, 'em_processo')
-        executor.submit(
-            executar_bot,
-            bot_path_absoluto,
-            cnpj,
-            periodo_inicial,
-            periodo_final,
-        )
+        submeter_job(job_id, bot_path_absoluto, cnpj, periodo_inicial, periodo_final, livro, diagnostico)
         return jsonify({
             'message': 'Processo iniciado com sucesso',
             'cnpj': cnpj,
+            'job_id': job_id,
+            'status': 'em_processo',
+            'bot_path': bot_path_absoluto,
+            'diagnostico': diagnostico
+        }), 202
+
+    except Exception as e:
+        logger.error(f"Erro geral: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/encerrar_lote', methods=['POST'])
+def iniciar_encerramento_lote():
+    """Encerra vários CNPJs com um único login: {bot_path, itens: [{cnpj, periodo_inicial, periodo_final, livro}]}"""
+    try:
+        dados = request.get_json()
+        if not dados or 'bot_path' not in dados or not dados.get('itens'):
+            return jsonify({'error': 'Parâmetros ausentes'}), 400
+
+        itens = []
+        for item in dados['itens']:
+            if not all(k in item for k in ('cnpj', 'periodo_inicial', 'periodo_final')):
+                return jsonify({'error': 'Parâmetros ausentes em um dos itens'}), 400
+
+            cnpj = re.sub(r'\D', '', item['cnpj'])
+            periodo_inicial = item['periodo_inicial'].replace('/', '')
+            periodo_final = item['periodo_final'].replace('/', '')
+
+            if not validar_cnpj(cnpj):
+                return jsonify({'error': f'CNPJ inválido: {item["cnpj"]}'}), 400
+            if not all(validar_periodo(p) for p in (periodo_inicial, periodo_final)):
+                return jsonify({'error': 'Período inválido. Use MMAAAA'}), 400
+            if item.get('livro'):
+                try:
+                    livros_do_modo(item['livro'])
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+
+            itens.append({
+                'cnpj': cnpj,
+                'periodo_inicial': periodo_inicial,
+                'periodo_final': periodo_final,
+                'livro': item.get('livro'),
+            })
+
+        bot_path_absoluto, erro = resolver_bot_path(dados['bot_path'])
+        if erro:
+            return jsonify({'error': erro}), 400
+        bot = carregar_bot(bot_path_absoluto)
+        if not hasattr(bot, 'run_lote'):
+            return jsonify({'error': 'Bot selecionado não suporta lote'}), 400
+
+        # Diário: cada item é um job próprio (/jobs/<id>, retomada na partida do servidor);
+        # itens iguais a um job que ainda está rodando ficam fora do lote
+        a_processar, ja_em_andamento = [], []
+        for item in itens:
+            item['livro'] = item['livro'] or getattr(bot, 'LIVRO', None)
+            job_id, rodando = abrir_job(item['cnpj'], os.path.basename(bot_path_absoluto), item['livro'],
+                                        item['periodo_inicial'], item['periodo_final'])
+            item['job_id'] = job_id
+            (ja_em_andamento if rodando else a_processar).append(item)
+
+        if not a_processar:
+            return jsonify({
+                'error': 'Todos os itens do lote já estão em andamento',
+                'ja_em_andamento': [item['job_id'] for item in ja_em_andamento],
+            }), 409
+
+        for item in a_processar:
+            atualizar_status(item['cnpj'], 'em_processo')
+        executor.submit(executar_lote, bot_path_absoluto, a_processar)
+        return jsonify({
+            'message': 'Lote iniciado com sucesso',
+            'itens': len(a_processar),
+            'job_ids': [item['job_id'] for item in a_processar],
+            'ja_em_andamento': [item['job_id'] for item in ja_em_andamento],
             'status': 'em_processo',
             'bot_path': bot_path_absoluto
         }), 202
@@ -162,48 +281,183 @@ def iniciar_encerramento():
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
-def executar_bot(bot_path_absoluto, cnpj, periodo_inicial, periodo_final):
+def submeter_job(job_id, bot_path_absoluto, cnpj, periodo_inicial, periodo_final, livro, diagnostico=None):
+    """Coloca o job no motor configurado; as etapas vão para o diário (tabela jobs).
+
+    Jobs com diagnóstico ligado rodam sempre numa thread do executor, onde o
+    contexto e a thread do job são exclusivos (trace e cProfile só dele).
+    """
+    etapa = lambda nome: registrar_etapa(job_id, nome)
+    diagnostico = diagnostico or {}
+    if MOTOR == 'async' and livro and not any(diagnostico.values()):
+        # Encerramento roda como um contexto a mais no navegador do motor assíncrono
+        futuro = motor.submeter(cnpj, periodo_inicial, periodo_final, livro, etapa)
+        futuro.add_done_callback(lambda f: executor.submit(finalizar_job_async, job_id, cnpj, f))
+    else:
+        executor.submit(
+            executar_bot,
+            bot_path_absoluto,
+            cnpj,
+            periodo_inicial,
+            periodo_final,
+            job_id,
+            livro=livro,
+            **diagnostico,
+        )
+
+def retomar_jobs_interrompidos():
+    """Reenfileira os jobs que estavam em andamento quando o servidor parou.
+
+    Os períodos já encerrados estão no livro-razão e são pulados; as sessões
+    salvas são descartadas para que a retomada comece com login novo.
+    """
+    interrompidos = jobs_interrompidos()
+    if not interrompidos:
+        return
+    descartar_sessoes()
+    for job in interrompidos:
+        bot_path_absoluto, erro = resolver_bot_path(job['bot'])
+        if erro:
+            logger.error(f"Job {job['id']} não pode ser retomado: {erro}")
+            finalizar_job(job['id'], 'erro')
+            continue
+        logger.info(f"Retomando job {job['id']} ({job['cnpj']}) a partir de {job['periodo_atual'] or job['periodo_inicial']}")
+        job_id, _ = abrir_job(job['cnpj'], job['bot'], job['livro'], job['periodo_inicial'], job['periodo_final'],
+                              retomar_em_andamento=True)
+        submeter_job(job_id, bot_path_absoluto, job['cnpj'], job['periodo_inicial'], job['periodo_final'], job['livro'])
+
+def carregar_bot(bot_path_absoluto):
+    """Importa o módulo do bot (bots/<nome>.py) para execução no próprio processo"""
+    nome = os.path.splitext(os.path.basename(bot_path_absoluto))[0]
+    return importlib.import_module(f'bots.{nome}')
+
+def registrar_sucesso(cnpj, resumo=None):
+    # Períodos que falharam de vez deixam o CNPJ como 'com_falhas', não 'concluido'
+    falhas = resumo.get('falhas', []) if resumo else []
+    status = 'com_falhas' if falhas else 'concluido'
+    if falhas:
+        logger.warning(f"Bot concluído para CNPJ {cnpj} com falhas em {falhas}")
+        mensagem = f'Movimento para {cnpj} encerrado com falhas em {len(falhas)} período(s): {", ".join(falhas)}'
+    else:
+        logger.info(f"Bot concluído com sucesso para CNPJ {cnpj}")
+        mensagem = f'Movimento para {cnpj} encerrado com sucesso!'
+    atualizar_status(cnpj, status, '100')
+    socketio.emit('encerramento_concluido', {
+        'message': mensagem,
+        'cnpj': cnpj,
+        'status': status,
+        'falhas': falhas
+    })
+    notificar_conclusao(cnpj, status=status, progresso='100')
+
+def registrar_erro(cnpj, mensagem):
+    logger.error(f"Erro ao executar bot: {mensagem}")
+    atualizar_status(cnpj, 'erro', '0')
+    socketio.emit('erro_processo', {
+        'message': f'Erro ao encerrar movimento: {mensagem}',
+        'cnpj': cnpj
+    })
+    notificar_conclusao(cnpj, status='erro', progresso='0')
+
+def executar_bot(bot_path_absoluto, cnpj, periodo_inicial, periodo_final, job_id=None, rastrear=False, perfilar=False,
+                 livro=None):
+    """Executa um job na thread do worker. `livro` (o gravado no diário) prevalece sobre o LIVRO do bot"""
+    etapa = (lambda nome: registrar_etapa(job_id, nome)) if job_id else None
     try:
         atualizar_status(cnpj, 'em_processo')
         print("Executando:", bot_path_absoluto)
-        result = subprocess.run(
-            ['python', bot_path_absoluto, cnpj, periodo_inicial, periodo_final],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',  # Garante leitura correta da saída
-            errors='replace'   # Substitui caracteres inválidos
-        )
-        print("stdout:", result.stdout)
-        print("stderr:", result.stderr)
-        if result.returncode == 0:
-            logger.info(f"Bot concluído com sucesso para CNPJ {cnpj}")
-            atualizar_status(cnpj, 'concluido', '100')
-            socketio.emit('encerramento_concluido', {
-                'message': f'Movimento para {cnpj} encerrado com sucesso!',
-                'cnpj': cnpj
-            })
-            notificar_conclusao(cnpj, status='concluido', progresso='100')
-            return True
-        else:
-            logger.error(f"Erro no bot: {result.stderr}")
-            atualizar_status(cnpj, 'erro', '0')
-            socketio.emit('erro_processo', {
-                'message': f'Erro ao encerrar movimento: {result.stderr}',
-                'cnpj': cnpj
-            })
-            notificar_conclusao(cnpj, status='erro', progresso='0')
-            return False
+        bot = carregar_bot(bot_path_absoluto)
+        livro = livro or getattr(bot, 'LIVRO', None)
+        # O contexto já nasce com a sessão autenticada salva, se ainda for válida
+        with pool.contexto(**opcoes_contexto(carregar_sessao())) as context, \
+                diagnosticar(context, job_id, rastrear, perfilar):
+            if livro:
+                # Bots de encerramento rodam direto no SigissPage, na thread do worker
+                page = context.new_page()
+                resumo = SigissPage(page, livro, etapa).encerrar_cliente(cnpj, periodo_inicial, periodo_final)
+                logger.info(f"Resumo do encerramento de {cnpj}: {resumo}")
+            else:
+                resumo = None
+                bot.run(None, cnpj, periodo_inicial, periodo_final, callback_status=etapa, context=context)
+
+        if job_id:
+            finalizar_job(job_id, 'com_falhas' if resumo and resumo['falhas'] else 'concluido', resumo)
+
+        registrar_sucesso(cnpj, resumo)
+        return True
     except Exception as e:
-        logger.error(f"Erro ao executar bot: {str(e)}")
-        atualizar_status(cnpj, 'erro', '0')
-        socketio.emit('erro_processo', {
-            'message': f'Erro ao executar processo: {str(e)}',
-            'cnpj': cnpj
-        })
-        notificar_conclusao(cnpj, status='erro', progresso='0')
+        if job_id:
+            finalizar_job(job_id, 'erro', {'erro': str(e)})
+        registrar_erro(cnpj, str(e))
         return False
 
+def finalizar_job_async(job_id, cnpj, futuro):
+    """Publica o resultado de um job do motor assíncrono"""
+    try:
+        resumo = futuro.result()
+        logger.info(f"Resumo do encerramento de {cnpj}: {resumo}")
+        finalizar_job(job_id, 'com_falhas' if resumo['falhas'] else 'concluido', resumo)
+        registrar_sucesso(cnpj, resumo)
+    except Exception as e:
+        finalizar_job(job_id, 'erro', {'erro': str(e)})
+        registrar_erro(cnpj, str(e))
+
+def executar_lote(bot_path_absoluto, itens):
+    try:
+        bot = carregar_bot(bot_path_absoluto)
+        with pool.contexto(**opcoes_contexto(carregar_sessao())) as context:
+            resultados = bot.run_lote(None, itens, context=context)
+    except Exception as e:
+        logger.error(f"Erro ao executar lote: {str(e)}")
+        resultados = [dict(item, status='erro', erro=str(e)) for item in itens]
+
+    # Cada item do lote tem o seu próprio status, no diário e na interface
+    for resultado in resultados:
+        cnpj = resultado['cnpj']
+        job_id = resultado.get('job_id')
+        if resultado['status'] == 'erro':
+            if job_id:
+                finalizar_job(job_id, 'erro', {'erro': resultado.get('erro')})
+            registrar_erro(cnpj, resultado.get('erro'))
+        else:
+            if job_id:
+                finalizar_job(job_id, resultado['status'], resultado)
+            registrar_sucesso(cnpj, resultado)
+    return resultados
+
+@app.route('/pool', methods=['GET'])
+def ocupacao_pool():
+    """Ocupação do pool de navegadores e do motor assíncrono"""
+    return jsonify(dict(pool.ocupacao(), motor=MOTOR, workers=WORKERS, motor_async=motor.ocupacao()))
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def obter_resultado_job(job_id):
+    """Situação do job no diário, com os períodos encerrados, pulados e com falha"""
+    job = obter_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<int:job_id>/artefatos', methods=['GET'])
+def listar_artefatos(job_id):
+    """Arquivos de diagnóstico do job (trace.zip, perfil.prof, perfil.txt)"""
+    return jsonify({'job_id': job_id, 'artefatos': artefatos(job_id)})
+
+@app.route('/jobs/<int:job_id>/artefatos/<path:nome>', methods=['GET'])
+def baixar_artefato(job_id, nome):
+    # send_from_directory recusa caminhos fora da pasta do job
+    return send_from_directory(os.path.abspath(pasta_job(job_id)), nome, as_attachment=True)
+
+@app.route('/passos', methods=['GET'])
+def tempos_passos():
+    """p50/p95/máximo por passo dos jobs (filtros opcionais ?desde=AAAA-MM-DD&cnpj=)"""
+    return jsonify(resumir(duracoes_passos(request.args.get('desde'), request.args.get('cnpj'))))
+
+@app.route('/captcha', methods=['GET'])
+def estatisticas_captcha():
+    """Latência e taxa de acerto do OCR do captcha desde o início do servidor"""
+    return jsonify(resolvedor.estatisticas())
+
 @app.route('/status/<cnpj>', methods=['GET'])
 def obter_status(cnpj):
     try:
@@ -308,10 +562,13 @@ def index():
         return f"Erro: {str(e)}", 500
 
 if __name__ == '__main__':
+    retomar_jobs_interrompidos()
     socketio.run(
         app,
         host='0.0.0.0',
         port=5000,
         debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true',
-        use_reloader=False
+        use_reloader=False,
+        # async_mode='threading' roda no Werkzeug; sem isso o servidor recusa subir sem terminal (Docker, benchmark)
+        allow_unsafe_werkzeug=True
     )
@@ -0,0 +1,23 @@
+import json
+import logging
+from datetime import datetime
+
+import websockets
+
+logger = logging.getLogger('sigiss.alertas')
+
+
+# Função para enviar alertas via WebSocket
+async def enviar_alerta(cnpj, status):
+    """Envia alertas via WebSocket para o servidor principal"""
+    try:
+        # Conecta ao servidor WebSocket na porta 5000 (mesma do Flask)
+        async with websockets.connect('ws://localhost:5000') as websocket:
+            await websocket.send(json.dumps({
+                "tipo": "encerramento_concluido",
+                "cnpj": cnpj,
+                "status": status,
+                "timestamp": datetime.now().isoformat()
+            }))
+    except Exception as e:
+        logger.error(f"Erro ao enviar alerta WebSocket: {e}")
@@ -0,0 +1,264 @@
+import io
+import logging
+import math
+import os
+import string
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:  # sem tesserocr cai no pytesseract, que abre um processo por leitura
+    tesserocr = None
+
+logger = logging.getLogger('sigiss.captcha')
+
+# O captcha do portal tem 4 caracteres alfanuméricos
+TAMANHO_CAPTCHA = 4
+WHITELIST = string.ascii_letters + string.digits
+CONFIG_PYTESSERACT = f"--psm 7 -c tessedit_char_whitelist={WHITELIST}"
+
+# Limiares da varredura de binarização (cada um gera um candidato para a votação)
+LIMIARES = tuple(int(x) for x in os.getenv("SIGISS_CAPTCHA_LIMIARES", "110,125,140,155,170").split(','))
+
+# Pixels pretos com menos vizinhos pretos que isso são considerados ruído
+MINIMO_VIZINHOS = 2
+
+# Pasta opcional para guardar as imagens de captcha que falharam (uma subpasta por job)
+# e as aceitas pelo portal (em rotulados/, com o texto no nome do arquivo)
+AMOSTRAS_DIR = os.getenv("SIGISS_AMOSTRAS_CAPTCHA")
+
+# 'tesseract' (só OCR), 'glifos' (só o classificador local) ou 'auto'
+# (classificador quando houver modelo treinado, OCR quando ele não resolver)
+ESTRATEGIA = os.getenv("SIGISS_CAPTCHA_SOLVER", "auto")
+MODELO_GLIFOS = os.getenv("SIGISS_MODELO_GLIFOS", "modelo_glifos.npz")
+
+
+def abrir_captcha(png):
+    """Imagem PIL a partir dos bytes do screenshot, sem passar pelo disco"""
+    return Image.open(io.BytesIO(png))
+
+
+def preprocessar_captcha(img):
+    """Converte para preto e branco para o OCR"""
+    img = img.convert('L')
+    return img.point(lambda x: 0 if x < 140 else 255, '1')
+
+
+def endireitar(cinza):
+    """Corrige a inclinação do texto pelo eixo principal dos pixels escuros"""
+    ys, xs = np.nonzero(cinza < cinza.mean())
+    if len(xs) < 10:
+        return cinza
+
+    dx = xs - xs.mean()
+    dy = ys - ys.mean()
+    angulo = math.degrees(0.5 * math.atan2(2 * (dx * dy).mean(), (dx * dx).mean() - (dy * dy).mean()))
+    if abs(angulo) < 1 or abs(angulo) > 20:
+        return cinza
+
+    img = Image.fromarray(cinza).rotate(angulo, resample=Image.BILINEAR, fillcolor=255)
+    return np.asarray(img)
+
+
+def remover_ruido(pilha, minimo_vizinhos=MINIMO_VIZINHOS):
+    """Apaga pixels pretos isolados em todas as binarizações de uma vez"""
+    preto = ~pilha
+    _, altura, largura = preto.shape
+    borda = np.pad(preto, ((0, 0), (1, 1), (1, 1))).astype(np.uint8)
+    vizinhos = sum(
+        borda[:, 1 + dy:1 + dy + altura, 1 + dx:1 + dx + largura]
+        for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0)
+    )
+    return ~(preto & (vizinhos >= minimo_vizinhos))
+
+
+def binarizacoes(img, limiares=LIMIARES):
+    """Pilha (n, altura, largura) de imagens binárias, uma por limiar (True = fundo).
+
+    A varredura de limiares e a remoção de ruído são feitas numa única
+    passada vetorizada sobre todos os candidatos.
+    """
+    cinza = endireitar(np.asarray(img.convert('L'), dtype=np.uint8))
+    pilha = cinza[None, :, :] >= np.asarray(limiares, dtype=np.uint8)[:, None, None]
+    return remover_ruido(pilha)
+
+
+def votar(textos):
+    """Escolhe o captcha mais provável entre as leituras dos candidatos.
+
+    Vence o texto válido mais frequente; em caso de empate, cada posição
+    recebe o caractere mais votado entre os textos válidos.
+    Retorna (texto, votos do texto escolhido).
+    """
+    validos = [t for t in textos if captcha_valido(t)]
+    if not validos:
+        return (textos[0] if textos else ''), 0
+
+    contagem = Counter(validos).most_common()
+    if len(contagem) == 1 or contagem[0][1] > contagem[1][1]:
+        return contagem[0]
+
+    texto = ''.join(Counter(posicao).most_common(1)[0][0] for posicao in zip(*validos))
+    return texto, Counter(validos)[texto]
+
+
+def captcha_valido(texto):
+    return len(texto) == TAMANHO_CAPTCHA and texto.isalnum()
+
+
+def salvar_amostra_captcha(png, job, tentativa):
+    """Guarda o captcha original de uma tentativa falha, se SIGISS_AMOSTRAS_CAPTCHA estiver definido"""
+    if not AMOSTRAS_DIR:
+        return
+    pasta = os.path.join(AMOSTRAS_DIR, str(job or threading.current_thread().name))
+    os.makedirs(pasta, exist_ok=True)
+    with open(os.path.join(pasta, f"captcha_tentativa_{tentativa}.png"), 'wb') as f:
+        f.write(png)
+
+
+def salvar_captcha_rotulado(png, texto):
+    """Guarda um captcha aceito pelo portal com o texto no nome, para treinar o classificador"""
+    if not AMOSTRAS_DIR:
+        return
+    pasta = os.path.join(AMOSTRAS_DIR, 'rotulados')
+    os.makedirs(pasta, exist_ok=True)
+    with open(os.path.join(pasta, f"{texto}_{time.time_ns()}.png"), 'wb') as f:
+        f.write(png)
+
+
+class ResolvedorCaptcha:
+    """OCR do captcha com o motor do tesseract mantido aberto durante a vida do worker.
+
+    Com tesserocr a PyTessBaseAPI é criada uma única vez por thread (ela não
+    é thread-safe) e reaproveitada em todas as tentativas, sem abrir um
+    processo novo do tesseract a cada leitura. Quando existe um modelo de
+    glifos treinado (sigiss.glifos) ele é tentado antes do OCR. Guarda
+    contadores de latência e de acerto para acompanhar a qualidade.
+    """
+
+    def __init__(self, limiares=LIMIARES, estrategia=ESTRATEGIA, modelo=MODELO_GLIFOS):
+        if estrategia not in ('tesseract', 'glifos', 'auto'):
+            raise ValueError(f"Estratégia de captcha inválida: {estrategia}")
+        self.limiares = limiares
+        self.estrategia = estrategia
+        self.modelo = modelo
+        self._classificador = None
+        self._classificador_carregado = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(limiares), thread_name_prefix='ocr')
+        self.leituras = 0
+        self.invalidas = 0
+        self.por_glifos = 0
+        self.aceitas = 0
+        self.recusadas = 0
+        self.tempo_total = 0.0
+        self.tempo_maximo = 0.0
+
+    @property
+    def motor(self):
+        return 'tesserocr' if tesserocr is not None else 'pytesseract'
+
+    def _api(self):
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_LINE)
+            api.SetVariable('tessedit_char_whitelist', WHITELIST)
+            self._local.api = api
+            logger.info(f"Motor tesseract iniciado para {threading.current_thread().name}")
+        return api
+
+    @property
+    def classificador(self):
+        """Classificador de glifos, carregado do modelo na primeira chamada (None se não houver)"""
+        with self._lock:
+            if not self._classificador_carregado:
+                self._classificador_carregado = True
+                if self.estrategia != 'tesseract' and os.path.exists(self.modelo):
+                    from sigiss.glifos import ClassificadorGlifos  # import tardio: glifos importa este módulo
+                    self._classificador = ClassificadorGlifos.carregar(self.modelo)
+                    logger.info(f"Classificador de glifos carregado de {self.modelo}")
+                elif self.estrategia == 'glifos':
+                    logger.warning(f"Modelo de glifos não encontrado em {self.modelo}")
+            return self._classificador
+
+    def _ocr(self, img):
+        if tesserocr is None:
+            return pytesseract.image_to_string(img, config=CONFIG_PYTESSERACT).strip()
+        api = self._api()
+        api.SetImage(img)
+        return api.GetUTF8Text().strip()
+
+    def ler(self, img):
+        """OCR de uma imagem já pré-processada"""
+        inicio = time.perf_counter()
+        texto = self._ocr(img)
+        self._contabilizar(texto, time.perf_counter() - inicio)
+        return texto
+
+    def resolver(self, img):
+        """Texto do captcha pela estratégia configurada"""
+        inicio = time.perf_counter()
+        texto = ''
+        if self.classificador is not None:
+            texto = self.classificador.classificar(img)
+            if captcha_valido(texto):
+                with self._lock:
+                    self.por_glifos += 1
+        if not captcha_valido(texto) and self.estrategia != 'glifos':
+            texto = self._votar(img)
+        self._contabilizar(texto, time.perf_counter() - inicio)
+        return texto
+
+    def _votar(self, img):
+        """Varre os limiares, lê os candidatos em paralelo e vota na resposta"""
+        candidatos = [Image.fromarray(b.astype(np.uint8) * 255) for b in binarizacoes(img, self.limiares)]
+        textos = list(self._executor.map(self._ocr, candidatos))
+        texto, votos = votar(textos)
+        logger.info(f"Candidatos do captcha: {textos} -> '{texto}' ({votos}/{len(textos)} votos)")
+        return texto
+
+    def _contabilizar(self, texto, duracao):
+        with self._lock:
+            self.leituras += 1
+            self.tempo_total += duracao
+            self.tempo_maximo = max(self.tempo_maximo, duracao)
+            if not captcha_valido(texto):
+                self.invalidas += 1
+
+    def registrar_resultado(self, aceito):
+        """Informa se o texto submetido foi aceito pelo portal"""
+        with self._lock:
+            if aceito:
+                self.aceitas += 1
+            else:
+                self.recusadas += 1
+
+    def estatisticas(self):
+        with self._lock:
+            submetidas = self.aceitas + self.recusadas
+            return {
+                'motor': self.motor,
+                'estrategia': self.estrategia,
+                'classificador': self._classificador is not None,
+                'por_glifos': self.por_glifos,
+                'leituras': self.leituras,
+                'invalidas': self.invalidas,
+                'submetidas': submetidas,
+                'aceitas': self.aceitas,
+                'recusadas': self.recusadas,
+                'taxa_acerto': round(self.aceitas / submetidas, 3) if submetidas else None,
+                'latencia_media_ms': round(self.tempo_total / self.leituras * 1000, 1) if self.leituras else None,
+                'latencia_maxima_ms': round(self.tempo_maximo * 1000, 1),
+            }
+
+
+# Instância única do processo, compartilhada pelo loop de login de todos os bots
+resolvedor = ResolvedorCaptcha()
@@ -0,0 +1,106 @@
+import logging
+import os
+from datetime import datetime
+
+from playwright.sync_api import expect
+
+from sigiss.db import DB_PATH, save_to_database, ultima_sincronizacao
+from sigiss.grade import paginas, paginas_async
+
+logger = logging.getLogger('sigiss.carteira')
+
+# Por quanto tempo (segundos) a carteira gravada no banco é considerada atual
+CARTEIRA_TTL = int(os.getenv("SIGISS_CARTEIRA_TTL", "3600"))
+
+
+def carteira_recente(ttl=CARTEIRA_TTL, db_path=DB_PATH):
+    """True se a carteira foi sincronizada há menos de `ttl` segundos"""
+    ultima = ultima_sincronizacao(db_path)
+    return ultima is not None and (datetime.now() - ultima).total_seconds() < ttl
+
+
+def ir_para_carteira(page, esperar_linhas=True):
+    """Abre Contribuinte > Carteira de Clientes e espera a tabela carregar.
+
+    Com esperar_linhas=False espera só o campo de pesquisa, suficiente para
+    abrir um cliente sem ler a carteira.
+    """
+    page.get_by_role("button", name="Contribuinte").click()
+    page.get_by_role("link", name="Carteira de Clientes").click()
+
+    main_frame = page.frame_locator('#main')
+    if esperar_linhas:
+        # Espera pelo primeiro elemento da tabela com timeout maior
+        main_frame.locator("tr.line").first.wait_for(state='visible', timeout=60000)
+    else:
+        main_frame.locator("#cnpj").wait_for(state='visible', timeout=60000)
+
+
+def _linhas_carteira(dados, linhas, numero):
+    for i, celulas in enumerate(linhas):
+        if len(celulas) >= 5:
+            dados.append(tuple(celulas[:5]))
+        else:
+            logger.warning(f"Linha {i+1} da página {numero} não tem o número esperado de células.")
+
+
+def extrair_carteira(page):
+    """Extrai (im, cnpj, nome, omisso, debito) de cada linha da carteira, em todas as páginas"""
+    main_frame = page.frame_locator('#main')
+    dados = []
+
+    for numero, linhas in enumerate(paginas(main_frame), start=1):
+        _linhas_carteira(dados, linhas, numero)
+
+    return dados
+
+
+async def extrair_carteira_async(page):
+    """extrair_carteira() para páginas da API assíncrona do Playwright"""
+    main_frame = page.frame_locator('#main')
+    dados = []
+
+    numero = 0
+    async for linhas in paginas_async(main_frame):
+        numero += 1
+        _linhas_carteira(dados, linhas, numero)
+
+    return dados
+
+
+def sincronizar_carteira(page, callback_status=None, forcar=False):
+    """Abre a carteira de clientes, extrai as linhas e sincroniza com o banco.
+
+    Se a carteira gravada ainda estiver dentro do SIGISS_CARTEIRA_TTL, só abre
+    a tela de pesquisa. Retorna o conjunto de mudanças, ou None sem extração.
+    """
+    if not forcar and carteira_recente():
+        logger.info("Carteira sincronizada recentemente, pulando extração")
+        ir_para_carteira(page, esperar_linhas=False)
+        return None
+
+    if callback_status:
+        callback_status('extraindo_dados')
+
+    ir_para_carteira(page)
+    dados = extrair_carteira(page)
+
+    # Só grava no banco o que mudou desde a última sincronização
+    return save_to_database(dados)
+
+
+def pesquisar_cliente(page, cnpj):
+    """Pesquisa o CNPJ na carteira e seleciona a linha do cliente"""
+    main_frame = page.frame_locator('#main')
+    main_frame.locator("#cnpj").fill(cnpj)
+    main_frame.get_by_role("button", name="Pesquisar").click()
+    # Pesquisar recarrega o #main; clicar na grade anterior (que pode ter o mesmo
+    # CNPJ) perde a seleção no recarregamento, então espera a grade filtrada
+    expect(main_frame.locator("tr.line").filter(has_not_text=cnpj)).to_have_count(0, timeout=30000)
+    main_frame.locator(f"td.cell.center:has-text('{cnpj}')").click()
+
+
+def abrir_cliente(page, cnpj):
+    """Pesquisa o CNPJ na carteira e entra na área do cliente (btnAcessar)"""
+    pesquisar_cliente(page, cnpj)
+    page.frame_locator('#main').locator("button[name='btnAcessar']").click()
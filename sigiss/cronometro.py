@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from sigiss.db import DB_PATH, duracoes_passos, registrar_passo
+from sigiss.falhas import classificar
+
+logger = logging.getLogger('sigiss.cronometro')
+
+# Resultados de passo que não contam como erro
+RESULTADOS_OK = {'ok', 'sessao_reaproveitada', 'ja_encerrado'}
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por posição mais próxima numa lista ordenada"""
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def resumir(registros):
+    """p50/p95/máximo por passo a partir de registros (passo, segundos, resultado)"""
+    por_passo = {}
+    for passo, segundos, resultado in registros:
+        item = por_passo.setdefault(passo, {'tempos': [], 'erros': 0})
+        item['tempos'].append(segundos)
+        if resultado not in RESULTADOS_OK:
+            item['erros'] += 1
+
+    resumo = {}
+    for passo, item in por_passo.items():
+        tempos = sorted(item['tempos'])
+        resumo[passo] = {
+            'execucoes': len(tempos),
+            'erros': item['erros'],
+            'p50': round(percentil(tempos, 50), 3),
+            'p95': round(percentil(tempos, 95), 3),
+            'max': round(tempos[-1], 3),
+            'total': round(sum(tempos), 3),
+        }
+    return resumo
+
+
+class Cronometro:
+    """Cronômetros nomeados dos passos de um job (login, captcha, carteira...).
+
+    Cada passo vai para a tabela job_steps com o CNPJ, a competência, o livro
+    e o resultado ('ok', a classe da falha ou o que o passo anotar).
+    """
+
+    def __init__(self, cnpj=None, db_path=DB_PATH):
+        self.cnpj = cnpj
+        self.db_path = db_path
+        self.registros = []
+
+    @contextmanager
+    def passo(self, nome, competencia=None, livro=None):
+        """Mede o bloco; o dict entregue pode trocar o 'resultado' do passo"""
+        registro = {'resultado': 'ok'}
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        except Exception as e:
+            registro['resultado'] = classificar(e)
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            self.registros.append((nome, segundos, registro['resultado']))
+            registrar_passo(self.cnpj, nome, segundos, registro['resultado'], competencia, livro, self.db_path)
+
+    @asynccontextmanager
+    async def passo_async(self, nome, competencia=None, livro=None):
+        """passo() para o motor assíncrono: a gravação no banco sai do event loop"""
+        registro = {'resultado': 'ok'}
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        except Exception as e:
+            registro['resultado'] = classificar(e)
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            self.registros.append((nome, segundos, registro['resultado']))
+            await asyncio.to_thread(
+                registrar_passo, self.cnpj, nome, segundos, registro['resultado'], competencia, livro, self.db_path
+            )
+
+    def resumo(self):
+        return resumir(self.registros)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p95/máximo por passo dos jobs gravados em job_steps")
+    parser.add_argument('--desde', help="Só passos gravados a partir de AAAA-MM-DD")
+    parser.add_argument('--cnpj', help="Só os passos de um CNPJ")
+    parser.add_argument('--json', action='store_true', help="Saída em JSON")
+    args = parser.parse_args()
+
+    resumo = resumir(duracoes_passos(args.desde, args.cnpj))
+    if args.json:
+        print(json.dumps(resumo, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'passo':<22}{'execuções':>10}{'erros':>7}{'p50 (s)':>10}{'p95 (s)':>10}{'max (s)':>10}")
+    for passo, item in sorted(resumo.items(), key=lambda par: -par[1]['total']):
+        print(f"{passo:<22}{item['execucoes']:>10}{item['erros']:>7}{item['p50']:>10.2f}{item['p95']:>10.2f}{item['max']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+logger = logging.getLogger('sigiss.db')
+
+DB_PATH = os.getenv("SIGISS_DB_PATH", "empresas.db")
+
+
+CAMPOS_EMPRESA = ('im', 'nome', 'omisso', 'debito')
+
+
+def criar_tabela_empresas(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS empresas (
+        im TEXT,
+        cnpj TEXT UNIQUE,
+        nome TEXT,
+        omisso TEXT,
+        debito TEXT,
+        status TEXT DEFAULT 'pendente',
+        progresso TEXT DEFAULT '0'
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS sincronizacoes_carteira (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sincronizado_em TEXT NOT NULL,
+        total INTEGER,
+        novos INTEGER,
+        alterados INTEGER,
+        removidos INTEGER
+    )''')
+
+
+# Configuração do banco de dados
+def save_to_database(dados, db_path=DB_PATH):
+    """Sincroniza a carteira extraída com a tabela empresas.
+
+    Compara com o que já está gravado e só escreve clientes novos ou com
+    algum campo alterado; status e progresso dos clientes existentes são
+    preservados. Clientes que sumiram da carteira são apenas informados.
+    Retorna o conjunto de mudanças: novos, alterados (com os campos antes e
+    depois), removidos e o horário da sincronização.
+    """
+    mudancas = {'novos': [], 'alterados': [], 'removidos': [], 'total': 0, 'sincronizado_em': None}
+    extraidos = {cnpj: dict(zip(CAMPOS_EMPRESA, (im, nome, omisso, debito))) for im, cnpj, nome, omisso, debito in dados}
+    if not extraidos:
+        # Carteira vazia é falha de extração; não marca a carteira como sincronizada
+        logger.warning("Nenhum cliente extraído, sincronização ignorada")
+        return mudancas
+
+    try:
+        with sqlite3.connect(db_path) as conn:
+            criar_tabela_empresas(conn)
+            gravados = {
+                linha[0]: dict(zip(CAMPOS_EMPRESA, linha[1:]))
+                for linha in conn.execute(f"SELECT cnpj, {', '.join(CAMPOS_EMPRESA)} FROM empresas")
+            }
+
+            novos, alterados = [], []
+            for cnpj, campos in extraidos.items():
+                anterior = gravados.get(cnpj)
+                if anterior is None:
+                    novos.append((cnpj, *campos.values()))
+                    mudancas['novos'].append(cnpj)
+                elif anterior != campos:
+                    alterados.append((*campos.values(), cnpj))
+                    mudancas['alterados'].append({
+                        'cnpj': cnpj,
+                        'campos': {c: (anterior[c], campos[c]) for c in CAMPOS_EMPRESA if anterior[c] != campos[c]},
+                    })
+            mudancas['removidos'] = [cnpj for cnpj in gravados if cnpj not in extraidos]
+            mudancas['total'] = len(extraidos)
+
+            conn.executemany(
+                f"INSERT INTO empresas (cnpj, {', '.join(CAMPOS_EMPRESA)}) VALUES (?, ?, ?, ?, ?)", novos
+            )
+            conn.executemany(
+                f"UPDATE empresas SET {', '.join(f'{c} = ?' for c in CAMPOS_EMPRESA)} WHERE cnpj = ?", alterados
+            )
+
+            mudancas['sincronizado_em'] = datetime.now().isoformat(timespec='seconds')
+            conn.execute(
+                '''INSERT INTO sincronizacoes_carteira (sincronizado_em, total, novos, alterados, removidos)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (mudancas['sincronizado_em'], mudancas['total'], len(novos), len(alterados), len(mudancas['removidos'])),
+            )
+
+        logger.info(
+            f"Carteira sincronizada: {mudancas['total']} clientes, {len(novos)} novos, "
+            f"{len(alterados)} alterados, {len(mudancas['removidos'])} fora da carteira"
+        )
+
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao salvar no banco de dados: {e}")
+
+    return mudancas
+
+
+def ultima_sincronizacao(db_path=DB_PATH):
+    """Horário da última sincronização da carteira, ou None se nunca houve"""
+    try:
+        with sqlite3.connect(db_path) as conn:
+            criar_tabela_empresas(conn)
+            linha = conn.execute('SELECT MAX(sincronizado_em) FROM sincronizacoes_carteira').fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao ler a última sincronização: {e}")
+        return None
+    return datetime.fromisoformat(linha[0]) if linha and linha[0] else None
+
+
+# Atualização de status no banco de dados
+def atualizar_status_db(cnpj, status, progresso, db_path=DB_PATH):
+    """Atualiza o status e progresso no banco de dados"""
+    try:
+        with sqlite3.connect(db_path) as conn:
+            c = conn.cursor()
+            c.execute('''
+                UPDATE empresas
+                SET status = ?, progresso = ?
+                WHERE cnpj = ?
+            ''', (status, progresso, cnpj))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao atualizar status: {e}")
+
+
+CAMPOS_NOTA = ('emissao', 'competencia', 'tributacao', 'servico', 'valor', 'tomador', 'status')
+
+
+def criar_tabela_notas(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS notas (
+        cnpj TEXT NOT NULL,
+        numero_nota TEXT NOT NULL,
+        emissao TEXT,
+        competencia TEXT,
+        tributacao TEXT,
+        servico TEXT,
+        valor REAL,
+        tomador TEXT,
+        status TEXT,
+        atualizado_em TEXT DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (cnpj, numero_nota)
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notas_cnpj_competencia ON notas (cnpj, competencia)')
+
+
+# Upsert que só reescreve a linha quando algum campo da nota mudou
+UPSERT_NOTA = f'''
+    INSERT INTO notas (cnpj, numero_nota, {', '.join(CAMPOS_NOTA)})
+    VALUES (?, ?, {', '.join('?' for _ in CAMPOS_NOTA)})
+    ON CONFLICT (cnpj, numero_nota) DO UPDATE SET
+        {', '.join(f'{c} = excluded.{c}' for c in CAMPOS_NOTA)},
+        atualizado_em = CURRENT_TIMESTAMP
+    WHERE ({', '.join(f'notas.{c}' for c in CAMPOS_NOTA)})
+        IS NOT ({', '.join(f'excluded.{c}' for c in CAMPOS_NOTA)})
+'''
+
+
+def salvar_notas(cnpj, notas, db_path=DB_PATH):
+    """Grava um lote de notas do CNPJ numa única transação.
+
+    Notas já gravadas e sem alteração não são reescritas. Retorna quantas
+    linhas foram inseridas ou atualizadas.
+    """
+    linhas = [(cnpj, n['numero_nota'], *(n[c] for c in CAMPOS_NOTA)) for n in notas]
+    try:
+        with sqlite3.connect(db_path) as conn:
+            criar_tabela_notas(conn)
+            antes = conn.total_changes
+            conn.executemany(UPSERT_NOTA, linhas)
+            alteradas = conn.total_changes - antes
+        logger.info(f"Notas de {cnpj}: {len(linhas)} recebidas, {alteradas} inseridas/atualizadas")
+        return alteradas
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao salvar notas: {e}")
+        return 0
+
+
+def criar_tabela_periodos(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS periodos_encerrados (
+        cnpj TEXT NOT NULL,
+        livro TEXT NOT NULL,
+        competencia TEXT NOT NULL,
+        situacao TEXT NOT NULL,
+        registrado_em TEXT DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (cnpj, livro, competencia)
+    )''')
+
+
+def competencias_encerradas(cnpj, livro, db_path=DB_PATH):
+    """Competências (MM/AAAA) do livro já conhecidas como encerradas para o CNPJ"""
+    try:
+        with sqlite3.connect(db_path) as conn:
+            criar_tabela_periodos(conn)
+            linhas = conn.execute(
+                'SELECT competencia FROM periodos_encerrados WHERE cnpj = ? AND livro = ?', (cnpj, livro)
+            ).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao ler períodos encerrados: {e}")
+        return set()
+    return {linha[0] for linha in linhas}
+
+
+def registrar_periodo_encerrado(cnpj, livro, competencia, situacao, db_path=DB_PATH):
+    """Anota no livro-razão que a competência está encerrada.
+
+    situacao: 'encerrado' (fechado pelo bot) ou 'ja_encerrado' (o portal já mostrava fechado).
+    """
+    try:
+        with sqlite3.connect(db_path) as conn:
+            criar_tabela_periodos(conn)
+            conn.execute(
+                '''INSERT OR IGNORE INTO periodos_encerrados (cnpj, livro, competencia, situacao)
+                   VALUES (?, ?, ?, ?)''',
+                (cnpj, livro, competencia, situacao),
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao registrar período encerrado: {e}")
+
+
+def criar_tabela_jobs(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cnpj TEXT NOT NULL,
+        bot TEXT NOT NULL,
+        livro TEXT,
+        periodo_inicial TEXT NOT NULL,
+        periodo_final TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'em_andamento',
+        etapa TEXT,
+        periodo_atual TEXT,
+        tentativas INTEGER DEFAULT 1,
+        resultado TEXT,
+        criado_em TEXT DEFAULT CURRENT_TIMESTAMP,
+        atualizado_em TEXT DEFAULT CURRENT_TIMESTAMP
+    )''')
+    # Diários criados antes da coluna de resultado
+    colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(jobs)")]
+    if 'resultado' not in colunas:
+        conn.execute("ALTER TABLE jobs ADD COLUMN resultado TEXT")
+
+
+def abrir_job(cnpj, bot, livro, periodo_inicial, periodo_final, retomar_em_andamento=False, db_path=DB_PATH):
+    """Registra o job no diário. Retorna (id, ja_em_andamento).
+
+    Um job igual que terminou com erro ou falhas é retomado: ganha mais uma
+    tentativa em vez de um registro novo. Um job igual ainda em andamento não
+    é tocado (ja_em_andamento=True), a não ser com retomar_em_andamento, usado
+    na partida do servidor para os jobs que o processo anterior deixou pela metade.
+    """
+    with sqlite3.connect(db_path) as conn:
+        criar_tabela_jobs(conn)
+        # Consulta e gravação na mesma transação: dois POSTs iguais não abrem dois jobs
+        conn.execute('BEGIN IMMEDIATE')
+        linha = conn.execute(
+            '''SELECT id, status FROM jobs
+               WHERE cnpj = ? AND bot = ? AND livro IS ? AND periodo_inicial = ? AND periodo_final = ?
+                 AND status != 'concluido'
+               ORDER BY id DESC LIMIT 1''',
+            (cnpj, bot, livro, periodo_inicial, periodo_final),
+        ).fetchone()
+        if linha and linha[1] == 'em_andamento' and not retomar_em_andamento:
+            logger.info(f"Job {linha[0]} de {cnpj} já está em andamento")
+            return linha[0], True
+        if linha:
+            conn.execute(
+                '''UPDATE jobs SET status = 'em_andamento', tentativas = tentativas + 1,
+                   atualizado_em = CURRENT_TIMESTAMP WHERE id = ?''',
+                (linha[0],),
+            )
+            logger.info(f"Retomando job {linha[0]} de {cnpj}")
+            return linha[0], False
+
+        cursor = conn.execute(
+            'INSERT INTO jobs (cnpj, bot, livro, periodo_inicial, periodo_final) VALUES (?, ?, ?, ?, ?)',
+            (cnpj, bot, livro, periodo_inicial, periodo_final),
+        )
+        return cursor.lastrowid, False
+
+
+def registrar_etapa(job_id, etapa, db_path=DB_PATH):
+    """Anota no diário a etapa atual do job (e o período, nas etapas processando_periodo_MM_AAAA)"""
+    periodo = None
+    if etapa.startswith('processando_periodo_'):
+        mes, ano = etapa.rsplit('_', 2)[1:]
+        periodo = f"{mes}/{ano}"
+    try:
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                '''UPDATE jobs SET etapa = ?, periodo_atual = COALESCE(?, periodo_atual),
+                   atualizado_em = CURRENT_TIMESTAMP WHERE id = ?''',
+                (etapa, periodo, job_id),
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao registrar etapa do job {job_id}: {e}")
+
+
+def finalizar_job(job_id, status, resultado=None, db_path=DB_PATH):
+    """Fecha o job no diário com o status final e o resultado (resumo ou erro) em JSON"""
+    try:
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, resultado = ?, atualizado_em = CURRENT_TIMESTAMP WHERE id = ?',
+                (status, json.dumps(resultado, ensure_ascii=False) if resultado is not None else None, job_id),
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao finalizar job {job_id}: {e}")
+
+
+def obter_job(job_id, db_path=DB_PATH):
+    """Registro do job com o resultado já decodificado, ou None"""
+    with sqlite3.connect(db_path) as conn:
+        criar_tabela_jobs(conn)
+        conn.row_factory = sqlite3.Row
+        linha = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if linha is None:
+        return None
+    job = dict(linha)
+    job['resultado'] = json.loads(job['resultado']) if job['resultado'] else None
+    return job
+
+
+def jobs_interrompidos(db_path=DB_PATH):
+    """Jobs que estavam em andamento quando o processo parou"""
+    with sqlite3.connect(db_path) as conn:
+        criar_tabela_jobs(conn)
+        conn.row_factory = sqlite3.Row
+        return [dict(linha) for linha in conn.execute("SELECT * FROM jobs WHERE status = 'em_andamento' ORDER BY id")]
+
+
+# ---------- Tempos dos passos dos jobs ----------
+
+def criar_tabela_passos(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS job_steps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cnpj TEXT,
+        competencia TEXT,
+        livro TEXT,
+        passo TEXT NOT NULL,
+        segundos REAL NOT NULL,
+        resultado TEXT NOT NULL,
+        criado_em TEXT DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_job_steps_passo ON job_steps (passo, criado_em)')
+
+
+def registrar_passo(cnpj, passo, segundos, resultado, competencia=None, livro=None, db_path=DB_PATH):
+    """Grava a duração de um passo; erro no banco não derruba o job"""
+    try:
+        with sqlite3.connect(db_path) as conn:
+            criar_tabela_passos(conn)
+            conn.execute(
+                '''INSERT INTO job_steps (cnpj, competencia, livro, passo, segundos, resultado)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (cnpj, competencia, livro, passo, segundos, resultado),
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Erro ao registrar passo '{passo}' de {cnpj}: {e}")
+
+
+def duracoes_passos(desde=None, cnpj=None, db_path=DB_PATH):
+    """Linhas (passo, segundos, resultado) gravadas, opcionalmente a partir de 'AAAA-MM-DD'"""
+    filtros, parametros = [], []
+    if desde:
+        filtros.append('criado_em >= ?')
+        parametros.append(desde)
+    if cnpj:
+        filtros.append('cnpj = ?')
+        parametros.append(cnpj)
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ''
+    with sqlite3.connect(db_path) as conn:
+        criar_tabela_passos(conn)
+        return conn.execute(f'SELECT passo, segundos, resultado FROM job_steps {where}', parametros).fetchall()
@@ -0,0 +1,80 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+from contextlib import contextmanager
+
+logger = logging.getLogger('sigiss.diagnostico')
+
+# Artefatos de diagnóstico (trace do Playwright, perfil do Python) ficam em <DIAGNOSTICO_DIR>/job_<id>
+DIAGNOSTICO_DIR = os.getenv("SIGISS_DIAGNOSTICO_DIR", "diagnostico")
+
+ARQUIVO_TRACE = 'trace.zip'
+ARQUIVO_PERFIL = 'perfil.prof'
+ARQUIVO_PERFIL_TEXTO = 'perfil.txt'
+
+# Linhas do relatório de texto do cProfile (ordenado por tempo acumulado)
+LINHAS_PERFIL = int(os.getenv("SIGISS_LINHAS_PERFIL", "60"))
+
+
+def pasta_job(job_id):
+    return os.path.join(DIAGNOSTICO_DIR, f"job_{job_id}")
+
+
+def artefatos(job_id):
+    """Arquivos de diagnóstico gravados para o job (nome e tamanho em bytes)"""
+    pasta = pasta_job(job_id)
+    try:
+        nomes = sorted(os.listdir(pasta))
+    except OSError:
+        return []
+    return [{'nome': nome, 'bytes': os.path.getsize(os.path.join(pasta, nome))} for nome in nomes]
+
+
+def _salvar_perfil(perfil, pasta):
+    perfil.dump_stats(os.path.join(pasta, ARQUIVO_PERFIL))
+    texto = io.StringIO()
+    pstats.Stats(perfil, stream=texto).sort_stats('cumulative').print_stats(LINHAS_PERFIL)
+    with open(os.path.join(pasta, ARQUIVO_PERFIL_TEXTO), 'w', encoding='utf-8') as f:
+        f.write(texto.getvalue())
+
+
+@contextmanager
+def diagnosticar(context, job_id, rastrear=False, perfilar=False):
+    """Liga o tracing do Playwright no contexto e/ou o cProfile na thread do job.
+
+    O trace (screenshots, snapshots do DOM e rede) abre com
+    `playwright show-trace trace.zip`; o perfil vai em .prof (snakeviz,
+    pstats) e num resumo em texto. Os artefatos são gravados mesmo se o job
+    falhar, que é justamente quando mais interessam.
+    """
+    if not (rastrear or perfilar):
+        yield None
+        return
+
+    pasta = pasta_job(job_id)
+    os.makedirs(pasta, exist_ok=True)
+
+    if rastrear:
+        context.tracing.start(title=f"job {job_id}", screenshots=True, snapshots=True, sources=False)
+    # O cProfile mede só a thread que o ligou: a do worker que executa o job
+    perfil = cProfile.Profile() if perfilar else None
+    if perfil:
+        perfil.enable()
+
+    try:
+        yield pasta
+    finally:
+        if perfil:
+            perfil.disable()
+            try:
+                _salvar_perfil(perfil, pasta)
+            except Exception as e:
+                logger.error(f"Erro ao salvar perfil do job {job_id}: {e}")
+        if rastrear:
+            try:
+                context.tracing.stop(path=os.path.join(pasta, ARQUIVO_TRACE))
+            except Exception as e:
+                logger.error(f"Erro ao salvar trace do job {job_id}: {e}")
+        logger.info(f"Diagnóstico do job {job_id} em {pasta}")
@@ -0,0 +1,356 @@
+import asyncio
+import logging
+import time
+
+from sigiss.alertas import enviar_alerta
+from sigiss.carteira import abrir_cliente, ir_para_carteira
+from sigiss.cronometro import Cronometro
+from sigiss.db import atualizar_status_db, competencias_encerradas, registrar_periodo_encerrado
+from sigiss.espera import Esperas
+from sigiss.falhas import POLITICAS, ControleTentativas, classificar, espera_retry, sinais_pagina
+from sigiss.login import entrar
+from sigiss.periodos import periodos_do_intervalo
+
+logger = logging.getLogger('sigiss.encerramento')
+
+# Diferenças entre os livros de Serviços Prestados e Serviços Tomados
+LIVROS = {
+    'prestado': {
+        'menu': 'tableEncerra_p',
+        'pagina': '../fechamento/prestado.php',
+        'texto_encerrado': 'já foi Encerrada',
+        'botao_encerrar': 'Encerrar Mês.',
+    },
+    'tomado': {
+        'menu': 'tableEncerra_t',
+        'pagina': '../fechamento/tomado.php',
+        'texto_encerrado': 'Escrituração já foi Encerrada',
+        'botao_encerrar': 'Encerrar Mês',
+    },
+}
+
+
+# Modo combinado: cada competência é aberta uma vez e os dois livros são encerrados nela
+AMBOS = 'ambos'
+
+
+def livros_do_modo(livro):
+    """Livros a encerrar para o modo pedido ('prestado', 'tomado' ou 'ambos')"""
+    if livro == AMBOS:
+        return list(LIVROS)
+    if livro not in LIVROS:
+        raise ValueError(f"Livro inválido: {livro}")
+    return [livro]
+
+
+def novo_resumo(livros):
+    """Resumo vazio: listas gerais e um resultado separado por livro"""
+    resumo = {'encerrados': [], 'pulados': [], 'falhas': [], 'erros': [], 'latencias': {}}
+    resumo['livros'] = {livro: {'encerrados': [], 'pulados': [], 'falhas': []} for livro in livros}
+    return resumo
+
+
+def marcar(resumo, livro, situacao, periodo):
+    """Anota o resultado do período no livro e nas listas gerais do resumo.
+
+    Com mais de um livro, as listas gerais identificam o livro ("01/2024 tomado").
+    """
+    resumo['livros'][livro][situacao].append(periodo)
+    resumo[situacao].append(periodo if len(resumo['livros']) == 1 else f"{periodo} {livro}")
+
+
+def planejar_periodos(cnpj, livros, periodo_inicial, periodo_final, resumo):
+    """Períodos do intervalo com os livros que ainda precisam ser encerrados em cada um.
+
+    Competências que o livro-razão (tabela periodos_encerrados) já conhece
+    como encerradas vão direto para 'pulados', sem navegar no portal.
+    Retorna uma lista de ((mes, ano), [livros pendentes]).
+    """
+    conhecidos = {livro: competencias_encerradas(cnpj, livro) for livro in livros}
+    plano = []
+    for mes, ano in periodos_do_intervalo(periodo_inicial, periodo_final):
+        pendentes = []
+        for livro in livros:
+            if f"{mes}/{ano}" in conhecidos[livro]:
+                marcar(resumo, livro, 'pulados', f"{mes}/{ano}")
+            else:
+                pendentes.append(livro)
+        if pendentes:
+            plano.append(((mes, ano), pendentes))
+
+    if resumo['pulados']:
+        logger.info(f"{cnpj}: {len(resumo['pulados'])} períodos já encerrados no livro-razão, sem navegar")
+    return plano
+
+
+def selecionar_periodo(page, esperas, mes, ano):
+    """Movimento > Alterar: deixa o portal na competência mes/ano"""
+    # Clica no botão "Movimento" no menu principal
+    page.get_by_role("button", name="Movimento").click()
+
+    # Acessa o frame principal
+    main_frame = page.frame_locator('#main')
+
+    # Clica no botão "Alterar"
+    alterar = main_frame.get_by_role("button", name="Alterar")
+    esperas.visivel(alterar, 'alterar', teto=60000)
+    alterar.click()
+
+    # Preenche período
+    select_mes = main_frame.locator('select[name="mes"]')
+    esperas.visivel(select_mes, 'form_periodo')
+    select_mes.select_option(value=mes)
+    main_frame.locator('input[name="ano"]').fill(ano)
+
+    # Ok recarrega o #main já no novo período
+    ok = main_frame.get_by_role("button", name="Ok")
+    esperas.navegacao(lambda: ok.click(timeout=30000), 'ok_periodo')
+
+
+def registrar_falha(resumo, livro, periodo, classe, controle):
+    """Marca o período como falho e guarda a classe e as tentativas feitas"""
+    marcar(resumo, livro, 'falhas', periodo)
+    resumo['erros'].append({
+        'periodo': periodo,
+        'livro': livro,
+        'classe': classe,
+        'tentativas': len(controle.historico),
+        'historico': list(controle.historico),
+    })
+
+
+def recuperar(page, esperas, cnpj, classe, espera, cronometro=None):
+    """Prepara a próxima tentativa: novo login (sessão caiu) ou espera com backoff"""
+    try:
+        if POLITICAS[classe]['relogin']:
+            entrar(page, job=cnpj, cronometro=cronometro)
+            ir_para_carteira(page, esperar_linhas=False)
+            abrir_cliente(page, cnpj)
+        else:
+            time.sleep(espera)
+            esperas.rede_ociosa('recuperacao')
+    except Exception as e:
+        # A tentativa seguinte falha de novo e é contada na política
+        logger.warning(f"Erro ao recuperar {cnpj} após falha '{classe}': {e}")
+
+
+def encerrar_livro(page, esperas, livro, reabrir_movimento, cronometro, periodo):
+    """Encerra um livro no período já selecionado.
+
+    Os passos 'menu_encerramento' e 'encerrar_mes' são cronometrados.
+    Retorna 'encerrados' ou 'pulados' (o portal já mostrava o mês encerrado).
+    """
+    config = LIVROS[livro]
+    main_frame = page.frame_locator('#main')
+
+    with cronometro.passo('menu_encerramento', periodo, livro) as passo:
+        # Depois do primeiro livro, volta ao Movimento (o período selecionado continua o mesmo)
+        if reabrir_movimento:
+            page.get_by_role("button", name="Movimento").click()
+
+        # Clique no menu Encerramento
+        encerramento_menu = main_frame.locator(f'//td[@class="textBold" and contains(@onclick, "{config["menu"]}") and contains(., "Encerramento")]')
+        esperas.visivel(encerramento_menu, 'menu_encerramento')
+        encerramento_menu.click()
+
+        # ----- FASE 2: VERIFICAÇÃO DE STATUS -----
+        # O submenu mostra o link do livro; se o mês já foi encerrado o texto avisa
+        link_encerrar = main_frame.locator(f'a[href="{config["pagina"]}"]')
+        esperas.visivel(link_encerrar.first, 'submenu_encerramento', teto=45000)
+        encerrado_locator = main_frame.locator(
+            f'xpath=//a[@href="{config["pagina"]}" and contains(text(), "{config["texto_encerrado"]}")]'
+        )
+
+        if encerrado_locator.count() > 0:
+            passo['resultado'] = 'ja_encerrado'
+            return 'pulados'
+
+    # ----- FASE 3: PROCESSO DE ENCERRAMENTO -----
+    with cronometro.passo('encerrar_mes', periodo, livro):
+        # Etapa 3.1: clica no link de encerramento
+        link_encerrar.click(timeout=30000)
+
+        # Etapa 3.2: clicar no botão 'encerrar mês'
+        encerrar_btn = main_frame.get_by_role("button", name=config['botao_encerrar'])
+        esperas.visivel(encerrar_btn, 'botao_encerrar')
+        esperas.navegacao(encerrar_btn.click, 'encerrar_mes')
+
+        # Etapa 3.3: Clicar no botão fechar (o portal pede confirmação)
+        fechar = main_frame.locator(".iconFechar")
+        esperas.visivel(fechar, 'fechar')
+        esperas.dialogo(fechar.click, 'confirmacao_fechar')
+        esperas.rede_ociosa('estabilizacao')
+    return 'encerrados'
+
+
+# Função principal de encerramento
+def encerrar_movimento(page, cnpj, periodo_inicial, periodo_final, livro='prestado', callback_status=None,
+                       cronometro=None):
+    """Executa o encerramento de um livro (ou dos dois, com livro='ambos') para um CNPJ e um intervalo de períodos.
+
+    Cada competência é selecionada uma única vez via Alterar e todos os livros
+    pendentes são encerrados nela antes de passar ao próximo mês. Períodos já
+    registrados como encerrados no livro-razão nem chegam a ser abertos.
+    Falhas são classificadas (sigiss.falhas) e repetidas conforme a política
+    da classe; o que falhar de vez vai para 'falhas' e 'erros'.
+    Os passos de cada competência vão para o cronômetro do job (job_steps).
+    Retorna um resumo com os períodos encerrados, pulados (já encerrados) e com
+    falha, no geral e por livro.
+    """
+    livros = livros_do_modo(livro)
+    resumo = novo_resumo(livros)
+    esperas = Esperas(page)
+    cronometro = cronometro or Cronometro(cnpj)
+
+    try:
+        # Gerar a lista de períodos a partir das entradas de início e fim (formato MMAAAA),
+        # já sem os meses que o livro-razão sabe que estão encerrados
+        plano = planejar_periodos(cnpj, livros, periodo_inicial, periodo_final, resumo)
+        total_periodos = len(plano)
+
+        for i, ((mes, ano), pendentes) in enumerate(plano):
+            inicio_periodo = time.perf_counter()
+            periodo = f"{mes}/{ano}"
+
+            # Calcular progresso
+            progresso = int((i / total_periodos) * 100)
+            atualizar_status_db(cnpj, 'em_processo', str(progresso))
+            if callback_status:
+                callback_status(f'processando_periodo_{mes}_{ano}')
+
+            pendentes = list(pendentes)
+            controle = ControleTentativas()
+            while pendentes:
+                livro_atual = None
+                try:
+                    # ----- FASE 1: ALTERAÇÃO DE PERÍODO -----
+                    with cronometro.passo('alterar_periodo', periodo, livro):
+                        selecionar_periodo(page, esperas, mes, ano)
+
+                    reabrir = False
+                    while pendentes:
+                        livro_atual = pendentes[0]
+                        situacao = encerrar_livro(page, esperas, livro_atual, reabrir, cronometro, periodo)
+                        marcar(resumo, livro_atual, situacao, periodo)
+                        registrar_periodo_encerrado(
+                            cnpj, livro_atual, periodo, 'encerrado' if situacao == 'encerrados' else 'ja_encerrado'
+                        )
+                        if situacao == 'pulados':
+                            print(f"⏭️ Período {periodo} ({livro_atual}) já encerrado. Pulando...")
+                        else:
+                            print(f"✅ Período {periodo} ({livro_atual}) encerrado com sucesso!")
+                        pendentes.pop(0)
+                        controle.zerar()
+                        reabrir = True
+
+                except Exception as e:
+                    classe = classificar(e, *sinais_pagina(page))
+                    if controle.registrar(e, classe):
+                        espera = espera_retry(classe, controle.tentativas(classe))
+                        print(f"🔁 Período {periodo}: falha '{classe}', nova tentativa em {espera:.0f}s")
+                        recuperar(page, esperas, cnpj, classe, espera, cronometro)
+                        continue
+
+                    # Esgotou as tentativas: falha o livro em curso, ou todos se
+                    # a falha foi ao selecionar o período
+                    falhos = [livro_atual] if livro_atual else list(pendentes)
+                    print(f"❌ Falha no período {periodo} ({', '.join(falhos)}): {classe} - {str(e)}")
+                    for livro_falho in falhos:
+                        registrar_falha(resumo, livro_falho, periodo, classe, controle)
+                        pendentes.remove(livro_falho)
+                    controle.zerar()
+                    try:
+                        page.screenshot(path=f"erro_{cnpj}_{mes}_{ano}.png")
+                    except Exception:
+                        pass
+                    esperas.rede_ociosa('recuperacao')
+
+            resumo['latencias'][periodo] = round(time.perf_counter() - inicio_periodo, 2)
+
+        # Atualizar status final (meses que falharam não deixam o job como concluído)
+        status_final = 'com_falhas' if resumo['falhas'] else 'concluido'
+        atualizar_status_db(cnpj, status_final, '100')
+        if callback_status:
+            callback_status(status_final)
+
+        resumo['esperas'] = esperas.resumo()
+        resumo['passos'] = cronometro.resumo()
+        logger.info(f"Latência por período ({livro}): {resumo['latencias']}")
+
+        # Enviar notificação de conclusão
+        try:
+            asyncio.run(enviar_alerta(cnpj, status_final))
+        except Exception as e:
+            print(f"Erro ao enviar alerta final: {e}")
+
+        return resumo
+
+    except Exception as e:
+        print(f"❌ Erro crítico: {str(e)}")
+        atualizar_status_db(cnpj, 'erro', '0')
+        if callback_status:
+            callback_status('erro')
+        raise
+
+    finally:
+        esperas.desligar()
+
+
+def normalizar_item(item, livro_padrao):
+    """Aceita um item de lote como dict ou tupla (cnpj, periodo_inicial, periodo_final[, livro])"""
+    if not isinstance(item, dict):
+        campos = ('cnpj', 'periodo_inicial', 'periodo_final', 'livro')
+        item = dict(zip(campos, item))
+    livro = item.get('livro') or livro_padrao
+    livros_do_modo(livro)  # valida o livro
+    return {
+        'cnpj': item['cnpj'],
+        'periodo_inicial': item['periodo_inicial'].replace('/', ''),
+        'periodo_final': item['periodo_final'].replace('/', ''),
+        'livro': livro,
+    }
+
+
+def processar_lote(page, itens, livro_padrao='prestado', callback_status=None, na_carteira=False):
+    """Encerra vários CNPJs na mesma sessão logada.
+
+    Para cada item: volta à Carteira de Clientes, pesquisa o CNPJ, entra no
+    cliente e executa o encerramento. Retorna uma lista com o resultado de cada item.
+    """
+    resultados = []
+
+    for item in itens:
+        resultado = dict(item) if isinstance(item, dict) else {'cnpj': item[0] if item else None}
+        cnpj = resultado.get('cnpj')
+
+        try:
+            # Item inválido (livro desconhecido, campo faltando) falha só ele, não o lote
+            item = normalizar_item(item, livro_padrao)
+            cnpj = item['cnpj']
+            resultado.update(item)
+
+            if not na_carteira:
+                ir_para_carteira(page, esperar_linhas=False)
+            na_carteira = False
+
+            cronometro = Cronometro(cnpj)
+            with cronometro.passo('abrir_cliente'):
+                abrir_cliente(page, cnpj)
+            resumo = encerrar_movimento(page, cnpj, item['periodo_inicial'], item['periodo_final'],
+                                        item['livro'], callback_status, cronometro)
+            resultado.update(resumo)
+            resultado['status'] = 'com_falhas' if resumo['falhas'] else 'concluido'
+
+        except Exception as e:
+            logger.error(f"Erro no item do lote {cnpj}: {e}")
+            resultado['status'] = 'erro'
+            resultado['erro'] = str(e)
+            try:
+                page.screenshot(path=f"erro_lote_{cnpj}.png")
+            except Exception:
+                pass
+
+        resultados.append(resultado)
+        logger.info(f"Lote: {cnpj} ({resultado.get('livro')}) -> {resultado['status']}")
+
+    return resultados
@@ -0,0 +1,121 @@
+import logging
+import os
+import time
+
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+logger = logging.getLogger('sigiss.espera')
+
+# Tetos de espera em milissegundos (configuráveis por variável de ambiente)
+TETOS = {
+    'navegacao': int(os.getenv("SIGISS_TETO_NAVEGACAO", "30000")),
+    'rede': int(os.getenv("SIGISS_TETO_REDE", "10000")),
+    'elemento': int(os.getenv("SIGISS_TETO_ELEMENTO", "30000")),
+    'dialogo': int(os.getenv("SIGISS_TETO_DIALOGO", "3000")),
+}
+
+
+def resumir_esperas(registros):
+    """Tempo total e máximo esperado por passo a partir dos registros de espera"""
+    passos = {}
+    for r in registros:
+        passo = passos.setdefault(r['nome'], {'esperas': 0, 'total': 0.0, 'maximo': 0.0, 'tetos_atingidos': 0})
+        passo['esperas'] += 1
+        passo['total'] += r['segundos']
+        passo['maximo'] = max(passo['maximo'], r['segundos'])
+        if not r['ok']:
+            passo['tetos_atingidos'] += 1
+    return passos
+
+
+class Esperas:
+    """Camada única de espera do fluxo no portal.
+
+    Em vez de pausas fixas, cada passo espera pelo sinal real: navegação do
+    frame #main, rede ociosa, visibilidade de um elemento ou um diálogo. Toda
+    espera tem um teto e o tempo efetivamente esperado fica registrado.
+
+    Diálogos (confirm/alert) são aceitos automaticamente enquanto a instância
+    estiver ligada à página.
+    """
+
+    def __init__(self, page, tetos=None):
+        self.page = page
+        self.tetos = dict(TETOS, **(tetos or {}))
+        self.registros = []
+        self.dialogos = 0
+        page.on("dialog", self._aceitar_dialogo)
+
+    def _aceitar_dialogo(self, dialog):
+        self.dialogos += 1
+        logger.info(f"Diálogo aceito: {dialog.message}")
+        dialog.accept()
+
+    def desligar(self):
+        self.page.remove_listener("dialog", self._aceitar_dialogo)
+
+    def _registrar(self, nome, tipo, inicio, ok):
+        segundos = time.perf_counter() - inicio
+        self.registros.append({'nome': nome, 'tipo': tipo, 'segundos': segundos, 'ok': ok})
+        if not ok:
+            logger.warning(f"Espera '{nome}' ({tipo}) atingiu o teto após {segundos:.2f}s")
+        return segundos
+
+    def frame_main(self):
+        """Frame do iframe #main (o objeto Frame sobrevive às navegações do iframe)"""
+        return self.page.locator('#main').element_handle(timeout=self.tetos['elemento']).content_frame()
+
+    def visivel(self, locator, nome, teto=None):
+        """Espera o elemento ficar visível. Estourar o teto é erro"""
+        inicio = time.perf_counter()
+        try:
+            locator.wait_for(state='visible', timeout=teto or self.tetos['elemento'])
+        except Exception:
+            self._registrar(nome, 'elemento', inicio, False)
+            raise
+        self._registrar(nome, 'elemento', inicio, True)
+
+    def navegacao(self, acao, nome, teto=None):
+        """Executa a ação e espera o #main terminar de carregar a nova página.
+
+        Se o portal responder sem navegar o frame, a espera termina no teto
+        sem erro; o passo seguinte valida o resultado.
+        """
+        frame = self.frame_main()
+        inicio = time.perf_counter()
+        try:
+            with frame.expect_navigation(wait_until='load', timeout=teto or self.tetos['navegacao']):
+                acao()
+        except PlaywrightTimeoutError:
+            self._registrar(nome, 'navegacao', inicio, False)
+            return
+        self._registrar(nome, 'navegacao', inicio, True)
+
+    def rede_ociosa(self, nome, teto=None):
+        """Espera o #main ficar sem requisições pendentes"""
+        inicio = time.perf_counter()
+        try:
+            self.frame_main().wait_for_load_state('networkidle', timeout=teto or self.tetos['rede'])
+        except PlaywrightTimeoutError:
+            self._registrar(nome, 'rede', inicio, False)
+            return
+        self._registrar(nome, 'rede', inicio, True)
+
+    def dialogo(self, acao, nome, teto=None):
+        """Executa a ação e espera o diálogo que ela dispara (aceito pelo handler)"""
+        inicio = time.perf_counter()
+        try:
+            with self.page.expect_event('dialog', timeout=teto or self.tetos['dialogo']):
+                acao()
+        except PlaywrightTimeoutError:
+            self._registrar(nome, 'dialogo', inicio, False)
+            return
+        self._registrar(nome, 'dialogo', inicio, True)
+
+    def total(self, desde=0):
+        """Segundos esperados a partir do registro de índice `desde`"""
+        return sum(r['segundos'] for r in self.registros[desde:])
+
+    def resumo(self):
+        """Tempo total e máximo esperado por passo"""
+        return resumir_esperas(self.registros)
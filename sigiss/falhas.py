@@ -0,0 +1,132 @@
+import logging
+import os
+import re
+
+from playwright.sync_api import Error as PlaywrightError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+logger = logging.getLogger('sigiss.falhas')
+
+# Classes de falha de um período
+TIMEOUT = 'timeout'
+SESSAO_EXPIRADA = 'sessao_expirada'
+ERRO_PORTAL = 'erro_portal'
+LOCALIZADOR_AUSENTE = 'localizador_ausente'
+DIALOGO = 'dialogo_nao_tratado'
+DESCONHECIDA = 'desconhecida'
+
+# Tentativas (contando a primeira), espera inicial em segundos (dobra a cada
+# nova tentativa) e se é preciso entrar de novo no portal antes de repetir
+POLITICAS = {
+    TIMEOUT: {'tentativas': 3, 'espera': 2.0, 'relogin': False},
+    SESSAO_EXPIRADA: {'tentativas': 2, 'espera': 0.0, 'relogin': True},
+    ERRO_PORTAL: {'tentativas': 3, 'espera': 5.0, 'relogin': False},
+    LOCALIZADOR_AUSENTE: {'tentativas': 2, 'espera': 1.0, 'relogin': False},
+    DIALOGO: {'tentativas': 2, 'espera': 1.0, 'relogin': False},
+    DESCONHECIDA: {'tentativas': 1, 'espera': 0.0, 'relogin': False},
+}
+FATOR_ESPERA = float(os.getenv("SIGISS_FATOR_ESPERA_RETRY", "1"))
+
+# Texto de página de erro do portal (PHP/servidor) dentro do #main
+PADRAO_ERRO_PORTAL = re.compile(
+    r'Fatal error|Parse error|Warning:|Internal Server Error|Service Unavailable|Bad Gateway|'
+    r'Erro ao processar|ocorreu um erro',
+    re.IGNORECASE,
+)
+
+# Trechos da tela de login: se aparecem, a sessão caiu
+SELETOR_TELA_LOGIN = 'div#div-img-captcha, input#confirma'
+
+# JS que lê o texto do #main e se a página ou o #main ainda carregam, sem
+# esperar (a página pode estar quebrada)
+ESTADO_MAIN = """
+() => {
+    const carregando = document.readyState !== 'complete';
+    const main = document.querySelector('#main');
+    try {
+        const doc = main && main.contentDocument;
+        if (!doc) return {texto: '', carregando};
+        return {
+            texto: doc.body ? doc.body.innerText.slice(0, 5000) : '',
+            carregando: carregando || doc.readyState !== 'complete',
+        };
+    } catch (e) { return {texto: '', carregando}; }
+}
+"""
+
+# No log do Playwright, o localizador achou o elemento (só não ficou visível/estável a tempo)
+PADRAO_ELEMENTO_RESOLVIDO = re.compile(r'locator resolved to|resolved to \d+ elements?')
+
+
+def classificar(erro, na_tela_login=False, texto_main='', carregando=False):
+    """Classe da falha a partir da exceção e do estado da página no momento do erro.
+
+    Um timeout só é localizador_ausente quando a página já terminou de
+    carregar e o elemento esperado não apareceu; com o #main ainda
+    carregando, ou com o elemento lá mas sem ficar pronto, é timeout.
+    """
+    if na_tela_login:
+        return SESSAO_EXPIRADA
+    if texto_main and PADRAO_ERRO_PORTAL.search(texto_main):
+        return ERRO_PORTAL
+
+    mensagem = str(erro)
+    if 'dialog' in mensagem.lower():
+        return DIALOGO
+    if isinstance(erro, PlaywrightTimeoutError):
+        # Espera por um elemento que nunca apareceu x página lenta
+        esperando_elemento = 'waiting for locator' in mensagem or 'waiting for get_by' in mensagem
+        if esperando_elemento and not carregando and not PADRAO_ELEMENTO_RESOLVIDO.search(mensagem):
+            return LOCALIZADOR_AUSENTE
+        return TIMEOUT
+    if isinstance(erro, PlaywrightError) and (
+        'strict mode violation' in mensagem or 'not attached' in mensagem or 'Element is not' in mensagem
+    ):
+        return LOCALIZADOR_AUSENTE
+    return DESCONHECIDA
+
+
+def sinais_pagina(page):
+    """Estado da página usado na classificação (na tela de login?, texto do #main, carregando?)"""
+    try:
+        estado = page.evaluate(ESTADO_MAIN)
+        return page.locator(SELETOR_TELA_LOGIN).count() > 0, estado['texto'], estado['carregando']
+    except Exception:
+        return False, '', False
+
+
+async def sinais_pagina_async(page):
+    try:
+        estado = await page.evaluate(ESTADO_MAIN)
+        return await page.locator(SELETOR_TELA_LOGIN).count() > 0, estado['texto'], estado['carregando']
+    except Exception:
+        return False, '', False
+
+
+def espera_retry(classe, tentativa):
+    """Segundos de espera antes da tentativa seguinte (backoff exponencial)"""
+    return POLITICAS[classe]['espera'] * (2 ** (tentativa - 1)) * FATOR_ESPERA
+
+
+class ControleTentativas:
+    """Conta as tentativas de um período por classe de falha.
+
+    registrar() retorna True enquanto a política da classe ainda permite
+    repetir; o histórico vai para o resumo quando o período falha de vez.
+    """
+
+    def __init__(self):
+        self.por_classe = {}
+        self.historico = []
+
+    def registrar(self, erro, classe):
+        self.por_classe[classe] = self.por_classe.get(classe, 0) + 1
+        self.historico.append({'classe': classe, 'erro': str(erro).splitlines()[0][:300]})
+        return self.por_classe[classe] < POLITICAS[classe]['tentativas']
+
+    def tentativas(self, classe):
+        return self.por_classe.get(classe, 0)
+
+    def zerar(self):
+        self.por_classe = {}
+        self.historico = []
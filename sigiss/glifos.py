@@ -0,0 +1,156 @@
+import logging
+import os
+import re
+import sys
+
+import numpy as np
+from PIL import Image
+
+from sigiss.captcha import TAMANHO_CAPTCHA, binarizacoes, captcha_valido
+
+logger = logging.getLogger('sigiss.glifos')
+
+# Limiar usado para separar os caracteres (o mesmo do pré-processamento original)
+LIMIAR_GLIFOS = 140
+
+# Colunas de tinta mais estreitas que isso são sujeira, não caractere
+LARGURA_MINIMA = 2
+
+# Cada caractere é normalizado para um quadrado LADO x LADO antes da comparação
+LADO = 16
+
+# Amostras rotuladas: o nome do arquivo começa com o texto do captcha (ex.: "aB3x.png", "aB3x_1718000000.png")
+ROTULO_ARQUIVO = re.compile(rf'^([A-Za-z0-9]{{{TAMANHO_CAPTCHA}}})(?:_[^.]*)?\.png$')
+
+
+def _juntar_mais_estreito(segmentos):
+    """Une o segmento mais estreito ao vizinho mais próximo"""
+    i = min(range(len(segmentos)), key=lambda k: segmentos[k][1] - segmentos[k][0])
+    if i == 0:
+        j = 1
+    elif i == len(segmentos) - 1:
+        j = i - 1
+    else:
+        vao_esquerda = segmentos[i][0] - segmentos[i - 1][1]
+        vao_direita = segmentos[i + 1][0] - segmentos[i][1]
+        j = i - 1 if vao_esquerda <= vao_direita else i + 1
+    a, b = min(i, j), max(i, j)
+    segmentos[a:b + 1] = [(segmentos[a][0], segmentos[b][1])]
+
+
+def _dividir_mais_largo(segmentos, perfil):
+    """Divide o segmento mais largo na coluna com menos tinta da sua metade central"""
+    i = max(range(len(segmentos)), key=lambda k: segmentos[k][1] - segmentos[k][0])
+    a, b = segmentos[i]
+    if b - a < 2 * LARGURA_MINIMA:
+        return False
+    margem = (b - a) // 4
+    corte = a + margem + int(np.argmin(perfil[a + margem:b - margem]))
+    segmentos[i:i + 1] = [(a, corte), (corte, b)]
+    return True
+
+
+def segmentar(img, tamanho=TAMANHO_CAPTCHA):
+    """Separa o captcha em `tamanho` caracteres pela projeção vertical da tinta.
+
+    Retorna uma matriz (tamanho, LADO * LADO) com os caracteres normalizados,
+    ou None quando não dá para separar a imagem nesse número de caracteres.
+    """
+    tinta = ~binarizacoes(img, (LIMIAR_GLIFOS,))[0]
+    perfil = tinta.sum(axis=0)
+
+    bordas = np.diff(np.concatenate(([0], (perfil > 0).astype(np.int8), [0])))
+    segmentos = [
+        (int(a), int(b))
+        for a, b in zip(np.flatnonzero(bordas == 1), np.flatnonzero(bordas == -1))
+        if b - a >= LARGURA_MINIMA
+    ]
+    if not segmentos:
+        return None
+
+    while len(segmentos) > tamanho:
+        _juntar_mais_estreito(segmentos)
+    while len(segmentos) < tamanho:
+        if not _dividir_mais_largo(segmentos, perfil):
+            return None
+
+    glifos = []
+    for a, b in segmentos:
+        recorte = tinta[:, a:b]
+        linhas = np.flatnonzero(recorte.any(axis=1))
+        if not len(linhas):
+            return None
+        recorte = recorte[linhas[0]:linhas[-1] + 1]
+        normalizado = Image.fromarray(recorte.astype(np.uint8) * 255).resize((LADO, LADO), Image.BILINEAR)
+        glifos.append(np.asarray(normalizado, dtype=np.float32).ravel() / 255)
+    return np.stack(glifos)
+
+
+def amostras_rotuladas(pasta):
+    """Percorre a pasta (e subpastas) devolvendo (caminho, rótulo) das amostras com texto no nome"""
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in sorted(arquivos):
+            rotulo = ROTULO_ARQUIVO.match(nome)
+            if rotulo:
+                yield os.path.join(raiz, nome), rotulo.group(1)
+
+
+class ClassificadorGlifos:
+    """Vizinho mais próximo sobre os caracteres recortados do captcha.
+
+    O captcha do portal sempre tem o mesmo estilo de fonte, então cada
+    caractere recortado e normalizado é comparado com os caracteres das
+    amostras já rotuladas e recebe o rótulo do mais parecido.
+    """
+
+    def __init__(self, vetores, rotulos):
+        self.vetores = np.asarray(vetores, dtype=np.float32)
+        self.rotulos = np.asarray(rotulos)
+
+    @classmethod
+    def treinar(cls, pasta):
+        vetores, rotulos = [], []
+        usadas = descartadas = 0
+        for caminho, texto in amostras_rotuladas(pasta):
+            with Image.open(caminho) as img:
+                glifos = segmentar(img)
+            if glifos is None:
+                descartadas += 1
+                continue
+            vetores.append(glifos)
+            rotulos.extend(texto)
+            usadas += 1
+
+        if not vetores:
+            raise ValueError(f"Nenhuma amostra rotulada utilizável em {pasta}")
+
+        logger.info(f"Classificador treinado com {usadas} captchas ({descartadas} descartados na segmentação)")
+        return cls(np.concatenate(vetores), rotulos)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as modelo:
+            return cls(modelo['vetores'], modelo['rotulos'])
+
+    def salvar(self, caminho):
+        np.savez_compressed(caminho, vetores=self.vetores, rotulos=self.rotulos)
+
+    def classificar(self, img):
+        """Texto do captcha, ou '' quando a segmentação falha"""
+        glifos = segmentar(img)
+        if glifos is None:
+            return ''
+        distancias = ((glifos[:, None, :] - self.vetores[None, :, :]) ** 2).sum(axis=2)
+        texto = ''.join(self.rotulos[distancias.argmin(axis=1)])
+        return texto if captcha_valido(texto) else ''
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Uso: python -m sigiss.glifos <pasta_amostras> <modelo.npz>")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO)
+    classificador = ClassificadorGlifos.treinar(sys.argv[1])
+    classificador.salvar(sys.argv[2])
+    print(f"✅ Modelo salvo em {sys.argv[2]} ({len(classificador.rotulos)} caracteres)")
@@ -0,0 +1,91 @@
+import logging
+import os
+
+from playwright.async_api import expect as expect_async
+from playwright.sync_api import expect
+
+logger = logging.getLogger('sigiss.grade')
+
+# Lê o texto de todas as células de todas as linhas da grade numa única
+# avaliação no navegador (em vez de um inner_text() por célula)
+LER_LINHAS = """
+(linhas, seletorCelulas) => linhas.map(linha =>
+    Array.from(linha.querySelectorAll(seletorCelulas), td => td.innerText.replace(/\\u00a0/g, '').trim())
+)
+"""
+
+# Controle de "próxima página" das grades do portal (bluecubeGrid)
+SELETOR_PROXIMA_PAGINA = os.getenv(
+    "SIGISS_SELETOR_PROXIMA_PAGINA",
+    "a:has-text('Próxima'), a:has-text('»'), [title='Próxima página']",
+)
+
+# Proteção contra grades que não sinalizam a última página
+MAX_PAGINAS = int(os.getenv("SIGISS_MAX_PAGINAS", "200"))
+
+
+def ler_pagina(escopo, seletor_linhas='tr.line', seletor_celulas='td'):
+    """Células (lista de textos) de cada linha da página atual da grade.
+
+    `escopo` é a página ou o frame_locator onde a grade está.
+    """
+    return escopo.locator(seletor_linhas).evaluate_all(LER_LINHAS, seletor_celulas)
+
+
+def _proxima_pagina(escopo):
+    """Controle de próxima página habilitado, ou None na última página"""
+    proxima = escopo.locator(SELETOR_PROXIMA_PAGINA).first
+    if proxima.count() == 0 or not proxima.is_visible():
+        return None
+    if 'disabled' in (proxima.get_attribute('class') or ''):
+        return None
+    return proxima
+
+
+def paginas(escopo, seletor_linhas='tr.line', seletor_celulas='td', max_paginas=MAX_PAGINAS, timeout=30000):
+    """Gera as linhas de cada página da grade, seguindo a paginação até o fim"""
+    for numero in range(1, max_paginas + 1):
+        linhas = ler_pagina(escopo, seletor_linhas, seletor_celulas)
+        yield linhas
+
+        proxima = _proxima_pagina(escopo) if linhas else None
+        if proxima is None:
+            return
+
+        # A troca de página é confirmada quando a primeira linha muda
+        primeira = escopo.locator(seletor_linhas).first
+        texto_anterior = primeira.inner_text()
+        proxima.click()
+        try:
+            expect(primeira).not_to_have_text(texto_anterior, timeout=timeout)
+        except AssertionError:
+            logger.warning(f"Grade não mudou após a página {numero}, encerrando paginação")
+            return
+
+    logger.warning(f"Paginação interrompida no limite de {max_paginas} páginas")
+
+
+async def paginas_async(escopo, seletor_linhas='tr.line', seletor_celulas='td', max_paginas=MAX_PAGINAS, timeout=30000):
+    """Versão assíncrona de paginas() para o motor asyncio (gerador assíncrono)"""
+    for numero in range(1, max_paginas + 1):
+        linhas = await escopo.locator(seletor_linhas).evaluate_all(LER_LINHAS, seletor_celulas)
+        yield linhas
+
+        if not linhas:
+            return
+        proxima = escopo.locator(SELETOR_PROXIMA_PAGINA).first
+        if await proxima.count() == 0 or not await proxima.is_visible():
+            return
+        if 'disabled' in (await proxima.get_attribute('class') or ''):
+            return
+
+        primeira = escopo.locator(seletor_linhas).first
+        texto_anterior = await primeira.inner_text()
+        await proxima.click()
+        try:
+            await expect_async(primeira).not_to_have_text(texto_anterior, timeout=timeout)
+        except AssertionError:
+            logger.warning(f"Grade não mudou após a página {numero}, encerrando paginação")
+            return
+
+    logger.warning(f"Paginação interrompida no limite de {max_paginas} páginas")
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from playwright.sync_api import expect
+
+from sigiss.captcha import (
+    abrir_captcha, captcha_valido, resolvedor, salvar_amostra_captcha, salvar_captcha_rotulado,
+)
+from sigiss.cronometro import Cronometro
+
+logger = logging.getLogger('sigiss.login')
+
+# Raiz do portal; aponte para o simulador local (simulador/portal.py) em testes de carga
+URL_BASE = os.getenv("SIGISS_BASE_URL", "https://acailandia.sigiss.com.br/acailandia/")
+URL_PORTAL = URL_BASE.rstrip('/') + "/index.php"
+TITULO_PORTAL = ".:: PREFEITURA - Açailândia ::."
+LINK_CONTADOR = "Acesso para acompanhamento de declarações e gestão de contribuintes vinculados a contadores no município de Açailândia."
+
+# Credenciais do contador
+CRC = os.getenv("SIGISS_CRC", "012452")
+SENHA = os.getenv("SIGISS_SENHA", "romario12")
+
+# Sessões autenticadas (storage_state do Playwright) reaproveitadas entre jobs
+SESSOES_DIR = os.getenv("SIGISS_SESSOES_DIR", "sessoes")
+SESSAO_TTL = int(os.getenv("SIGISS_SESSAO_TTL", "1800"))  # segundos
+
+
+def caminho_sessao(crc, slot=None):
+    """Arquivo da sessão do CRC para o slot (por padrão, a thread atual).
+
+    Jobs simultâneos não compartilham sessão (o portal guarda o cliente
+    selecionado na sessão); jobs seguidos no mesmo slot reaproveitam.
+    """
+    slot = slot or threading.current_thread().name
+    return os.path.join(SESSOES_DIR, f"{crc}_{slot}.json")
+
+
+def carregar_sessao(crc=CRC, slot=None):
+    """Retorna a sessão salva do CRC, ou None se não existir ou tiver expirado"""
+    caminho = caminho_sessao(crc, slot)
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            sessao = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if time.time() - sessao.get('salvo_em', 0) > SESSAO_TTL:
+        descartar_sessao(crc, slot)
+        return None
+    return sessao
+
+
+def opcoes_contexto(sessao):
+    """Argumentos para new_context() que restauram a sessão salva"""
+    if not sessao:
+        return {}
+    return {'storage_state': sessao['storage_state']}
+
+
+def gravar_sessao(url, storage_state, crc=CRC, slot=None):
+    """Grava o storage_state e a URL da área logada após um login bem-sucedido"""
+    os.makedirs(SESSOES_DIR, exist_ok=True)
+    caminho = caminho_sessao(crc, slot)
+    sessao = {
+        'url': url,
+        'salvo_em': time.time(),
+        'storage_state': storage_state,
+    }
+    # Escrita atômica para não deixar arquivo pela metade
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(sessao, f)
+    os.replace(temporario, caminho)
+    logger.info(f"Sessão salva em {caminho}")
+
+
+def descartar_sessoes(crc=CRC):
+    """Apaga as sessões salvas do CRC em todos os slots (ex.: ao retomar jobs após um reinício)"""
+    try:
+        arquivos = os.listdir(SESSOES_DIR)
+    except OSError:
+        return
+    for nome in arquivos:
+        if nome.startswith(f"{crc}_") and nome.endswith('.json'):
+            os.remove(os.path.join(SESSOES_DIR, nome))
+
+
+def salvar_sessao(page, crc=CRC):
+    gravar_sessao(page.url, page.context.storage_state(), crc)
+
+
+def descartar_sessao(crc=CRC, slot=None):
+    try:
+        os.remove(caminho_sessao(crc, slot))
+    except OSError:
+        pass
+
+
+def sessao_ativa(page, sessao):
+    """Verificação barata: abre a área logada e procura o menu do contador"""
+    try:
+        page.goto(sessao['url'])
+        page.get_by_role("button", name="Contribuinte").wait_for(state='visible', timeout=5000)
+        return True
+    except Exception as e:
+        logger.info(f"Sessão salva inválida: {e}")
+        return False
+
+
+def resolver_captcha(page, job=None):
+    """Loop de OCR do captcha. Retorna True quando o login passa"""
+    tentativas = 0
+
+    while tentativas < 10:
+        tentativas += 1
+
+        # Espera a imagem aparecer e capturar
+        captcha_element = page.query_selector('div#div-img-captcha img')
+        src = captcha_element.get_attribute('src')
+        png = captcha_element.screenshot()
+
+        # varre vários limiares em memória, lê todos em paralelo e vota no texto
+        texto_ocr = resolvedor.resolver(abrir_captcha(png))
+        print(f"OCR capturado: '{texto_ocr}'")
+
+        # Validar o OCR
+        if captcha_valido(texto_ocr):
+            print("OCR válido, preenchendo campo...")
+            page.fill('#confirma', texto_ocr)
+
+            time.sleep(1)
+            # clicar no btn login
+            page.get_by_role("button", name="  Login").click()
+
+            # Espera um pouco para verificar se o login foi bem-sucedido
+            page.wait_for_timeout(3000)
+
+            # Verifica se ainda está na tela do captcha (indicando falha)
+            erro_captcha = page.query_selector("#mensagem-erro")
+
+            if erro_captcha and erro_captcha.inner_text().strip() != "":
+                print("Captcha incorreto, tentando novamente...")
+                resolvedor.registrar_resultado(False)
+                salvar_amostra_captcha(png, job, tentativas)
+                # Atualiza o captcha clicando no div
+                page.click("#div-img-captcha")
+                page.wait_for_function(f"document.querySelector('div#div-img-captcha img').getAttribute('src') != '{src}'")
+                continue
+            else:
+                print("Login provavelmente bem-sucedido.")
+                resolvedor.registrar_resultado(True)
+                salvar_captcha_rotulado(png, texto_ocr)
+                return True
+        else:
+            salvar_amostra_captcha(png, job, tentativas)
+            print("OCR inválido, atualizando captcha para tentar de novo...")
+            page.click("#div-img-captcha")  # atualiza a imagem clicando
+            page.wait_for_timeout(1000)  # espera recarregar
+
+    print("Não foi possível resolver o captcha após várias tentativas.")
+    return False
+
+
+def entrar(page, crc=CRC, senha=SENHA, job=None, cronometro=None):
+    """Entra na área do contador, reaproveitando a sessão salva quando ainda vale.
+
+    O contexto da página deve ter sido criado com opcoes_contexto(carregar_sessao(crc)).
+    O tempo do captcha vai para o cronômetro do job (passo 'captcha').
+    Retorna True se a sessão salva foi reaproveitada e False após um login novo;
+    levanta RuntimeError se o captcha não for resolvido.
+    """
+    sessao = carregar_sessao(crc)
+    if sessao and sessao_ativa(page, sessao):
+        logger.info("Sessão reaproveitada, pulando login com captcha")
+        return True
+
+    if sessao:
+        # Sessão expirada no portal: começa do zero, sem os cookies antigos
+        descartar_sessao(crc)
+        page.context.clear_cookies()
+
+    # Login
+    page.goto(URL_PORTAL)
+    expect(page).to_have_title(TITULO_PORTAL)
+
+    # Acesso à área de contadores
+    page.get_by_role("row", name=LINK_CONTADOR, exact=True).get_by_role("link").click()
+
+    # Preenchimento das credenciais
+    page.get_by_role("textbox", name="CRC do Contador").fill(crc)
+    page.get_by_role("textbox", name="******").fill(senha)
+
+    with (cronometro or Cronometro(job)).passo('captcha') as passo:
+        resolvido = resolver_captcha(page, job)
+        if not resolvido:
+            passo['resultado'] = 'falhou'
+    if not resolvido:
+        # Mesmo comportamento do MotorAsync._entrar: sem login não há o que continuar
+        raise RuntimeError("Não foi possível resolver o captcha após várias tentativas.")
+
+    salvar_sessao(page, crc)
+    return False
@@ -0,0 +1,460 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright, expect
+
+from sigiss.captcha import (
+    abrir_captcha, captcha_valido, resolvedor, salvar_amostra_captcha, salvar_captcha_rotulado,
+)
+from sigiss.carteira import carteira_recente, extrair_carteira_async
+from sigiss.cronometro import Cronometro
+from sigiss.db import atualizar_status_db, registrar_periodo_encerrado, save_to_database
+from sigiss.encerramento import LIVROS, livros_do_modo, marcar, novo_resumo, planejar_periodos, registrar_falha
+from sigiss.espera import TETOS, resumir_esperas
+from sigiss.falhas import POLITICAS, ControleTentativas, classificar, espera_retry, sinais_pagina_async
+from sigiss.login import (
+    CRC, LINK_CONTADOR, SENHA, TITULO_PORTAL, URL_PORTAL, carregar_sessao, descartar_sessao,
+    gravar_sessao, opcoes_contexto,
+)
+from sigiss.perfil import BloqueioRecursos, opcoes_lancamento, perfil_atual, registrar_economia
+
+logger = logging.getLogger('sigiss.motor_async')
+
+# Quantos CNPJs ficam em andamento ao mesmo tempo no navegador compartilhado
+CONCORRENCIA = int(os.getenv("SIGISS_CONCORRENCIA", "10"))
+
+
+class EsperasAsync:
+    """Versão assíncrona de sigiss.espera.Esperas (mesmos tetos e registros)"""
+
+    def __init__(self, page, tetos=None):
+        self.page = page
+        self.tetos = dict(TETOS, **(tetos or {}))
+        self.registros = []
+        page.on("dialog", self._aceitar_dialogo)
+
+    async def _aceitar_dialogo(self, dialog):
+        logger.info(f"Diálogo aceito: {dialog.message}")
+        await dialog.accept()
+
+    def _registrar(self, nome, tipo, inicio, ok):
+        segundos = time.perf_counter() - inicio
+        self.registros.append({'nome': nome, 'tipo': tipo, 'segundos': segundos, 'ok': ok})
+        if not ok:
+            logger.warning(f"Espera '{nome}' ({tipo}) atingiu o teto após {segundos:.2f}s")
+
+    async def frame_main(self):
+        handle = await self.page.locator('#main').element_handle(timeout=self.tetos['elemento'])
+        return await handle.content_frame()
+
+    async def visivel(self, locator, nome, teto=None):
+        inicio = time.perf_counter()
+        try:
+            await locator.wait_for(state='visible', timeout=teto or self.tetos['elemento'])
+        except Exception:
+            self._registrar(nome, 'elemento', inicio, False)
+            raise
+        self._registrar(nome, 'elemento', inicio, True)
+
+    async def navegacao(self, acao, nome, teto=None):
+        frame = await self.frame_main()
+        inicio = time.perf_counter()
+        try:
+            async with frame.expect_navigation(wait_until='load', timeout=teto or self.tetos['navegacao']):
+                await acao()
+        except PlaywrightTimeoutError:
+            self._registrar(nome, 'navegacao', inicio, False)
+            return
+        self._registrar(nome, 'navegacao', inicio, True)
+
+    async def rede_ociosa(self, nome, teto=None):
+        inicio = time.perf_counter()
+        try:
+            frame = await self.frame_main()
+            await frame.wait_for_load_state('networkidle', timeout=teto or self.tetos['rede'])
+        except PlaywrightTimeoutError:
+            self._registrar(nome, 'rede', inicio, False)
+            return
+        self._registrar(nome, 'rede', inicio, True)
+
+    async def dialogo(self, acao, nome, teto=None):
+        inicio = time.perf_counter()
+        try:
+            async with self.page.expect_event('dialog', timeout=teto or self.tetos['dialogo']):
+                await acao()
+        except PlaywrightTimeoutError:
+            self._registrar(nome, 'dialogo', inicio, False)
+            return
+        self._registrar(nome, 'dialogo', inicio, True)
+
+    def resumo(self):
+        return resumir_esperas(self.registros)
+
+
+class MotorAsync:
+    """Motor asyncio do fluxo de encerramento.
+
+    Um único Chromium atende vários CNPJs ao mesmo tempo, cada um no seu
+    próprio BrowserContext, limitado por `concorrencia`. O event loop roda
+    numa thread própria; o servidor entrega jobs com submeter(), que devolve
+    um concurrent.futures.Future.
+    """
+
+    def __init__(self, concorrencia=CONCORRENCIA):
+        self.concorrencia = concorrencia
+        self._loop = None
+        self._thread = None
+        self._lock_thread = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._semaforo = None
+        self._slots = None
+        self._lock_browser = None
+        self._lock_carteira = None
+        self.na_fila = 0
+        self.em_andamento = 0
+        self.finalizados = 0
+
+    # ----- ciclo de vida -----
+
+    def _garantir_loop(self):
+        with self._lock_thread:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='motor-async', daemon=True)
+                self._thread.start()
+
+    def submeter(self, cnpj, periodo_inicial, periodo_final, livro, callback_status=None):
+        """Agenda o encerramento de um CNPJ no event loop do motor.
+
+        callback_status (síncrono) recebe as etapas do job e roda fora do event loop.
+        """
+        self._garantir_loop()
+        return asyncio.run_coroutine_threadsafe(
+            self.encerrar(cnpj, periodo_inicial, periodo_final, livro, callback_status), self._loop
+        )
+
+    @staticmethod
+    async def _status(callback_status, etapa):
+        if callback_status:
+            await asyncio.to_thread(callback_status, etapa)
+
+    async def _iniciar(self):
+        if self._lock_browser is None:
+            self._lock_browser = asyncio.Lock()
+            self._lock_carteira = asyncio.Lock()
+            self._semaforo = asyncio.Semaphore(self.concorrencia)
+            # Cada slot tem a sua sessão salva: jobs simultâneos não dividem sessão
+            self._slots = asyncio.Queue()
+            for i in range(self.concorrencia):
+                self._slots.put_nowait(f"async-{i}")
+
+        async with self._lock_browser:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(**opcoes_lancamento())
+
+    async def fechar(self):
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+        self._browser = self._playwright = None
+
+    def ocupacao(self):
+        return {
+            'concorrencia': self.concorrencia,
+            'na_fila': self.na_fila,
+            'em_andamento': self.em_andamento,
+            'finalizados': self.finalizados,
+        }
+
+    # ----- fluxo -----
+
+    async def encerrar(self, cnpj, periodo_inicial, periodo_final, livro='prestado', callback_status=None):
+        """Login (ou sessão salva), abre o cliente e encerra os períodos do livro"""
+        self.na_fila += 1
+        try:
+            await self._iniciar()
+            await self._semaforo.acquire()
+            slot = await self._slots.get()
+        finally:
+            self.na_fila -= 1
+
+        self.em_andamento += 1
+        # Tempo de cada passo do job (job_steps), como no fluxo síncrono
+        cronometro = Cronometro(cnpj)
+        try:
+            context = await self._browser.new_context(**opcoes_contexto(carregar_sessao(CRC, slot)))
+            bloqueio = None
+            if perfil_atual()['bloquear']:
+                bloqueio = BloqueioRecursos(perfil_atual()['bloquear'])
+                await context.route("**/*", bloqueio.rota_async)
+
+            page = await context.new_page()
+            try:
+                await self._status(callback_status, 'iniciando_login')
+                await self._entrar(page, slot, cnpj, cronometro)
+                async with cronometro.passo_async('carteira'):
+                    na_carteira = await self._sincronizar_carteira(page, callback_status)
+                await self._status(callback_status, 'abrindo_cliente')
+                async with cronometro.passo_async('abrir_cliente'):
+                    await self._abrir_cliente(page, cnpj, na_carteira)
+                return await self._encerrar_movimento(
+                    page, slot, cnpj, periodo_inicial, periodo_final, livro, cronometro, callback_status
+                )
+            except Exception:
+                await asyncio.to_thread(atualizar_status_db, cnpj, 'erro', '0')
+                raise
+            finally:
+                registrar_economia(bloqueio)
+                await context.close()
+        finally:
+            self.em_andamento -= 1
+            self.finalizados += 1
+            self._slots.put_nowait(slot)
+            self._semaforo.release()
+
+    async def _entrar(self, page, slot, job, cronometro):
+        """Login com os passos 'login' e 'captcha' cronometrados, como sigiss.login.entrar"""
+        async with cronometro.passo_async('login') as passo:
+            sessao = carregar_sessao(CRC, slot)
+            if sessao:
+                try:
+                    await page.goto(sessao['url'])
+                    await page.get_by_role("button", name="Contribuinte").wait_for(state='visible', timeout=5000)
+                    logger.info(f"[{slot}] Sessão reaproveitada, pulando login com captcha")
+                    passo['resultado'] = 'sessao_reaproveitada'
+                    return
+                except Exception as e:
+                    logger.info(f"[{slot}] Sessão salva inválida: {e}")
+                    descartar_sessao(CRC, slot)
+                    await page.context.clear_cookies()
+
+            await page.goto(URL_PORTAL)
+            await expect(page).to_have_title(TITULO_PORTAL)
+            await page.get_by_role("row", name=LINK_CONTADOR, exact=True).get_by_role("link").click()
+            await page.get_by_role("textbox", name="CRC do Contador").fill(CRC)
+            await page.get_by_role("textbox", name="******").fill(SENHA)
+
+            async with cronometro.passo_async('captcha') as passo_captcha:
+                resolvido = await self._resolver_captcha(page, slot, job)
+                if not resolvido:
+                    passo_captcha['resultado'] = 'falhou'
+            if not resolvido:
+                raise RuntimeError("Não foi possível resolver o captcha após várias tentativas.")
+
+    async def _resolver_captcha(self, page, slot, job=None):
+        """Até 10 tentativas de OCR + envio do login; True quando o portal aceita"""
+        for tentativa in range(1, 11):
+            captcha = page.locator('div#div-img-captcha img')
+            src = await captcha.get_attribute('src')
+            png = await captcha.screenshot()
+
+            # OCR fora do event loop para não travar os outros jobs
+            texto = await asyncio.to_thread(resolvedor.resolver, abrir_captcha(png))
+            logger.info(f"[{slot}] OCR capturado (tentativa {tentativa}): '{texto}'")
+
+            if captcha_valido(texto):
+                await page.fill('#confirma', texto)
+                await page.get_by_role("button", name="  Login").click()
+                await page.wait_for_timeout(3000)
+
+                erro = await page.query_selector("#mensagem-erro")
+                if erro and (await erro.inner_text()).strip() != "":
+                    resolvedor.registrar_resultado(False)
+                    salvar_amostra_captcha(png, job, tentativa)
+                    await page.click("#div-img-captcha")
+                    await page.wait_for_function(
+                        f"document.querySelector('div#div-img-captcha img').getAttribute('src') != '{src}'"
+                    )
+                    continue
+
+                resolvedor.registrar_resultado(True)
+                salvar_captcha_rotulado(png, texto)
+                gravar_sessao(page.url, await page.context.storage_state(), CRC, slot)
+                return True
+
+            salvar_amostra_captcha(png, job, tentativa)
+            await page.click("#div-img-captcha")
+            await page.wait_for_timeout(1000)
+
+        return False
+
+    async def _ir_para_carteira(self, page, esperar_linhas=True):
+        await page.get_by_role("button", name="Contribuinte").click()
+        await page.get_by_role("link", name="Carteira de Clientes").click()
+
+        main_frame = page.frame_locator('#main')
+        if esperar_linhas:
+            await main_frame.locator("tr.line").first.wait_for(state='visible', timeout=60000)
+        else:
+            await main_frame.locator("#cnpj").wait_for(state='visible', timeout=60000)
+
+    async def _sincronizar_carteira(self, page, callback_status=None):
+        """Mesma regra de sigiss.carteira.sincronizar_carteira: lê a carteira só
+        quando a gravada passou do SIGISS_CARTEIRA_TTL.
+
+        O lock garante uma leitura por janela de TTL: jobs que chegam durante a
+        leitura esperam e encontram a carteira já atualizada. Retorna True se a
+        página ficou na carteira.
+        """
+        async with self._lock_carteira:
+            if await asyncio.to_thread(carteira_recente):
+                return False
+            await self._status(callback_status, 'extraindo_dados')
+            await self._ir_para_carteira(page)
+            dados = await extrair_carteira_async(page)
+            await asyncio.to_thread(save_to_database, dados)
+            return True
+
+    async def _abrir_cliente(self, page, cnpj, na_carteira=False):
+        if not na_carteira:
+            await self._ir_para_carteira(page, esperar_linhas=False)
+
+        main_frame = page.frame_locator('#main')
+        await main_frame.locator("#cnpj").fill(cnpj)
+        await main_frame.get_by_role("button", name="Pesquisar").click()
+        # Mesma espera de sigiss.carteira.pesquisar_cliente: só clica na grade já filtrada
+        await expect(main_frame.locator("tr.line").filter(has_not_text=cnpj)).to_have_count(0, timeout=30000)
+        await main_frame.locator(f"td.cell.center:has-text('{cnpj}')").click()
+        await main_frame.locator("button[name='btnAcessar']").click()
+
+    async def _encerrar_livro(self, page, esperas, livro, reabrir_movimento, cronometro, periodo):
+        """Encerra um livro no período já selecionado; retorna 'encerrados' ou 'pulados'.
+
+        Os passos 'menu_encerramento' e 'encerrar_mes' são cronometrados.
+        """
+        config = LIVROS[livro]
+        main_frame = page.frame_locator('#main')
+
+        async with cronometro.passo_async('menu_encerramento', periodo, livro) as passo:
+            if reabrir_movimento:
+                await page.get_by_role("button", name="Movimento").click()
+
+            menu = main_frame.locator(
+                f'//td[@class="textBold" and contains(@onclick, "{config["menu"]}") and contains(., "Encerramento")]'
+            )
+            await esperas.visivel(menu, 'menu_encerramento')
+            await menu.click()
+
+            # ----- FASE 2: VERIFICAÇÃO DE STATUS -----
+            link_encerrar = main_frame.locator(f'a[href="{config["pagina"]}"]')
+            await esperas.visivel(link_encerrar.first, 'submenu_encerramento', teto=45000)
+            encerrado = main_frame.locator(
+                f'xpath=//a[@href="{config["pagina"]}" and contains(text(), "{config["texto_encerrado"]}")]'
+            )
+            if await encerrado.count() > 0:
+                passo['resultado'] = 'ja_encerrado'
+                return 'pulados'
+
+        # ----- FASE 3: PROCESSO DE ENCERRAMENTO -----
+        async with cronometro.passo_async('encerrar_mes', periodo, livro):
+            await link_encerrar.click(timeout=30000)
+            encerrar_btn = main_frame.get_by_role("button", name=config['botao_encerrar'])
+            await esperas.visivel(encerrar_btn, 'botao_encerrar')
+            await esperas.navegacao(encerrar_btn.click, 'encerrar_mes')
+
+            fechar = main_frame.locator(".iconFechar")
+            await esperas.visivel(fechar, 'fechar')
+            await esperas.dialogo(fechar.click, 'confirmacao_fechar')
+            await esperas.rede_ociosa('estabilizacao')
+        return 'encerrados'
+
+    async def _selecionar_periodo(self, page, esperas, mes, ano):
+        main_frame = page.frame_locator('#main')
+        await page.get_by_role("button", name="Movimento").click()
+        alterar = main_frame.get_by_role("button", name="Alterar")
+        await esperas.visivel(alterar, 'alterar', teto=60000)
+        await alterar.click()
+
+        select_mes = main_frame.locator('select[name="mes"]')
+        await esperas.visivel(select_mes, 'form_periodo')
+        await select_mes.select_option(value=mes)
+        await main_frame.locator('input[name="ano"]').fill(ano)
+        ok = main_frame.get_by_role("button", name="Ok")
+        await esperas.navegacao(lambda: ok.click(timeout=30000), 'ok_periodo')
+
+    async def _recuperar(self, page, esperas, slot, cnpj, classe, espera, cronometro):
+        """Novo login (sessão caiu) ou espera com backoff antes da próxima tentativa"""
+        try:
+            if POLITICAS[classe]['relogin']:
+                await self._entrar(page, slot, cnpj, cronometro)
+                await self._abrir_cliente(page, cnpj)
+            else:
+                await asyncio.sleep(espera)
+                await esperas.rede_ociosa('recuperacao')
+        except Exception as e:
+            logger.warning(f"[{slot}] erro ao recuperar {cnpj} após falha '{classe}': {e}")
+
+    async def _encerrar_movimento(self, page, slot, cnpj, periodo_inicial, periodo_final, livro, cronometro,
+                                  callback_status=None):
+        livros = livros_do_modo(livro)
+        resumo = novo_resumo(livros)
+        esperas = EsperasAsync(page)
+
+        plano = await asyncio.to_thread(planejar_periodos, cnpj, livros, periodo_inicial, periodo_final, resumo)
+        for i, ((mes, ano), pendentes) in enumerate(plano):
+            inicio_periodo = time.perf_counter()
+            periodo = f"{mes}/{ano}"
+            progresso = int((i / len(plano)) * 100)
+            await asyncio.to_thread(atualizar_status_db, cnpj, 'em_processo', str(progresso))
+            await self._status(callback_status, f'processando_periodo_{mes}_{ano}')
+
+            pendentes = list(pendentes)
+            controle = ControleTentativas()
+            while pendentes:
+                livro_atual = None
+                try:
+                    # ----- FASE 1: ALTERAÇÃO DE PERÍODO (uma vez para todos os livros) -----
+                    async with cronometro.passo_async('alterar_periodo', periodo, livro):
+                        await self._selecionar_periodo(page, esperas, mes, ano)
+
+                    reabrir = False
+                    while pendentes:
+                        livro_atual = pendentes[0]
+                        situacao = await self._encerrar_livro(page, esperas, livro_atual, reabrir, cronometro, periodo)
+                        marcar(resumo, livro_atual, situacao, periodo)
+                        await asyncio.to_thread(
+                            registrar_periodo_encerrado, cnpj, livro_atual, periodo,
+                            'encerrado' if situacao == 'encerrados' else 'ja_encerrado',
+                        )
+                        logger.info(f"{cnpj}: período {periodo} ({livro_atual}) -> {situacao}")
+                        pendentes.pop(0)
+                        controle.zerar()
+                        reabrir = True
+
+                except Exception as e:
+                    classe = classificar(e, *await sinais_pagina_async(page))
+                    if controle.registrar(e, classe):
+                        espera = espera_retry(classe, controle.tentativas(classe))
+                        logger.warning(f"{cnpj}: período {periodo} falhou ({classe}), nova tentativa em {espera:.0f}s")
+                        await self._recuperar(page, esperas, slot, cnpj, classe, espera, cronometro)
+                        continue
+
+                    falhos = [livro_atual] if livro_atual else list(pendentes)
+                    logger.error(f"{cnpj}: falha no período {periodo} ({', '.join(falhos)}): {classe} - {e}")
+                    for livro_falho in falhos:
+                        registrar_falha(resumo, livro_falho, periodo, classe, controle)
+                        pendentes.remove(livro_falho)
+                    controle.zerar()
+                    try:
+                        await page.screenshot(path=f"erro_{cnpj}_{mes}_{ano}.png")
+                    except Exception:
+                        pass
+                    await esperas.rede_ociosa('recuperacao')
+
+            resumo['latencias'][periodo] = round(time.perf_counter() - inicio_periodo, 2)
+
+        status_final = 'com_falhas' if resumo['falhas'] else 'concluido'
+        await asyncio.to_thread(atualizar_status_db, cnpj, status_final, '100')
+        await self._status(callback_status, status_final)
+
+        resumo['esperas'] = esperas.resumo()
+        resumo['passos'] = cronometro.resumo()
+        return resumo
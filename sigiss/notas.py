@@ -0,0 +1,60 @@
+import logging
+import os
+
+from sigiss.grade import paginas
+
+logger = logging.getLogger('sigiss.notas')
+
+# Grade do Historico Emissões NF-e
+SELETOR_NOTAS = 'table.bluecubeGrid tr.line'
+SELETOR_CELULAS = 'td.cell'
+
+# Quantidade máxima de notas entregues ao destino de uma vez
+TAMANHO_LOTE = int(os.getenv("SIGISS_LOTE_NOTAS", "500"))
+
+
+def converter_valor(texto):
+    """'1.234,56' -> 1234.56"""
+    return float(texto.replace('.', '').replace(',', '.').strip())
+
+
+def analisar_nota(celulas):
+    """Nota a partir das células de uma linha da grade, ou None se a linha não for uma nota"""
+    if len(celulas) < 9:
+        return None
+    return {
+        'numero_nota': celulas[0],
+        'emissao': celulas[1],
+        'competencia': celulas[2],
+        'tributacao': celulas[3],
+        'servico': celulas[4],
+        'valor': converter_valor(celulas[5]),
+        'tomador': celulas[6],
+        'status': celulas[7],
+    }
+
+
+def extrair_notas(escopo, tamanho_lote=TAMANHO_LOTE):
+    """Gera lotes de notas da grade de histórico, página por página.
+
+    Cada página é lida numa única avaliação e a paginação é seguida até o
+    fim; só um lote fica em memória por vez, mesmo com milhares de notas.
+    """
+    lote = []
+    for numero, linhas in enumerate(paginas(escopo, SELETOR_NOTAS, SELETOR_CELULAS), start=1):
+        for celulas in linhas:
+            try:
+                nota = analisar_nota(celulas)
+            except ValueError as e:
+                logger.warning(f"Nota ignorada na página {numero}: {e}")
+                continue
+            if nota:
+                lote.append(nota)
+            if len(lote) >= tamanho_lote:
+                yield lote
+                lote = []
+
+        # Fecha o lote no fim de cada página para o destino acompanhar o progresso
+        if lote:
+            yield lote
+            lote = []
@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from sigiss.login import carregar_sessao, opcoes_contexto
+
+logger = logging.getLogger('sigiss.perfil')
+
+# Flags do Chromium para rodar em servidor (sem GPU, /dev/shm pequeno, container como root)
+ARGS_SERVIDOR = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-background-timer-throttling',
+    '--disable-renderer-backgrounding',
+    '--mute-audio',
+    '--no-first-run',
+]
+
+# Perfis de execução: 'producao' roda sem janela e sem recursos pesados,
+# 'visual' é o comportamento antigo, para acompanhar o bot na tela
+PERFIS = {
+    'producao': {
+        'headless': True,
+        'args': ARGS_SERVIDOR,
+        'bloquear': ['image', 'font', 'media'],
+    },
+    'visual': {
+        'headless': False,
+        'args': [],
+        'bloquear': [],
+    },
+}
+
+# Folhas de estilo ficam liberadas por padrão: sem CSS elementos como o
+# .iconFechar podem ficar sem tamanho e deixam de ser "visíveis" para o Playwright
+if os.getenv("SIGISS_BLOQUEAR_CSS", "false").lower() == 'true':
+    PERFIS['producao']['bloquear'] = PERFIS['producao']['bloquear'] + ['stylesheet']
+
+# URLs que nunca são bloqueadas (além das imagens do documento principal, ver abaixo)
+PADRAO_PERMITIDO = os.getenv("SIGISS_RECURSOS_PERMITIDOS", r"captcha")
+
+# Tamanho médio estimado (bytes) de cada tipo de recurso bloqueado; requisições
+# abortadas não chegam a informar o tamanho real, então a economia reportada
+# (bytes_economizados_estimados) é só contagem x estimativa, não serve para dimensionamento
+TAMANHO_ESTIMADO = {
+    'image': 12 * 1024,
+    'font': 40 * 1024,
+    'media': 200 * 1024,
+    'stylesheet': 15 * 1024,
+}
+
+
+def perfil_atual():
+    nome = os.getenv("SIGISS_PERFIL", "producao")
+    if nome not in PERFIS:
+        raise ValueError(f"Perfil inválido: {nome}")
+    return PERFIS[nome]
+
+
+def opcoes_lancamento():
+    """Argumentos de chromium.launch() para o perfil configurado"""
+    perfil = perfil_atual()
+    return {'headless': perfil['headless'], 'args': list(perfil['args'])}
+
+
+def _do_documento_principal(request):
+    try:
+        return request.frame.parent_frame is None
+    except Exception:  # requisições de service worker não têm frame
+        return False
+
+
+class BloqueioRecursos:
+    """Handler de rota que aborta recursos não essenciais e contabiliza a economia"""
+
+    def __init__(self, tipos, padrao_permitido=PADRAO_PERMITIDO):
+        self.tipos = set(tipos)
+        self.permitido = re.compile(padrao_permitido, re.IGNORECASE)
+        self.por_tipo = Counter()
+        self.bytes_economizados_estimados = 0
+
+    def bloquear(self, request):
+        """Decide se a requisição deve ser abortada, contabilizando a economia.
+
+        Imagens do documento principal (login com o captcha, menus do topo)
+        passam sempre: não dependemos da URL do captcha do portal; o que é
+        bloqueado são as imagens das páginas carregadas no #main.
+        """
+        if request.resource_type == 'image' and _do_documento_principal(request):
+            return False
+        if request.resource_type in self.tipos and not self.permitido.search(request.url):
+            self.por_tipo[request.resource_type] += 1
+            self.bytes_economizados_estimados += TAMANHO_ESTIMADO.get(request.resource_type, 0)
+            return True
+        return False
+
+    def __call__(self, route):
+        if self.bloquear(route.request):
+            route.abort()
+        else:
+            route.continue_()
+
+    async def rota_async(self, route):
+        """Mesmo handler para a API assíncrona do Playwright"""
+        if self.bloquear(route.request):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    @property
+    def bloqueadas(self):
+        return sum(self.por_tipo.values())
+
+    def relatorio(self):
+        return {
+            'bloqueadas': self.bloqueadas,
+            'por_tipo': dict(self.por_tipo),
+            'bytes_economizados_estimados': self.bytes_economizados_estimados,
+        }
+
+
+def novo_contexto(browser, **context_options):
+    """Cria um BrowserContext com o bloqueio de recursos do perfil.
+
+    Retorna (context, bloqueio); bloqueio é None quando o perfil não bloqueia nada.
+    """
+    context = browser.new_context(**context_options)
+    tipos = perfil_atual()['bloquear']
+    if not tipos:
+        return context, None
+
+    bloqueio = BloqueioRecursos(tipos)
+    context.route("**/*", bloqueio)
+    return context, bloqueio
+
+
+def registrar_economia(bloqueio):
+    if bloqueio and bloqueio.bloqueadas:
+        logger.info(
+            f"Recursos bloqueados no job: {bloqueio.bloqueadas} "
+            f"(~{bloqueio.bytes_economizados_estimados / 1024:.0f} KB economizados, estimativa) {dict(bloqueio.por_tipo)}"
+        )
+
+
+@contextmanager
+def contexto_avulso(playwright):
+    """Navegador e contexto próprios para execução do bot fora do servidor"""
+    browser = playwright.chromium.launch(**opcoes_lancamento())
+    context, bloqueio = novo_contexto(browser, **opcoes_contexto(carregar_sessao()))
+    try:
+        yield context
+    finally:
+        registrar_economia(bloqueio)
+        context.close()
+        browser.close()
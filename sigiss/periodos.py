@@ -0,0 +1,23 @@
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+
+
+# Geração de períodos
+def gerar_periodos(mes_inicio, ano_inicio, mes_fim, ano_fim):
+    """Gera lista de períodos no formato (MM, AAAA)"""
+    periodos = []
+    data_inicio = datetime(int(ano_inicio), int(mes_inicio), 1)
+    data_fim = datetime(int(ano_fim), int(mes_fim), 1)
+
+    atual = data_inicio
+    while atual <= data_fim:
+        periodos.append((f"{atual.month:02d}", str(atual.year)))
+        atual += relativedelta(months=1)
+    return periodos
+
+
+def periodos_do_intervalo(periodo_inicial, periodo_final):
+    """Períodos entre dois valores MMAAAA (ou MM/AAAA), inclusive"""
+    periodo_inicial = periodo_inicial.replace('/', '')
+    periodo_final = periodo_final.replace('/', '')
+    return gerar_periodos(periodo_inicial[:2], periodo_inicial[2:], periodo_final[:2], periodo_final[2:])
@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from playwright.sync_api import sync_playwright
+
+from sigiss.perfil import novo_contexto, opcoes_lancamento, registrar_economia
+
+try:
+    import psutil
+except ImportError:  # sem psutil a reciclagem por memória fica desativada
+    psutil = None
+
+logger = logging.getLogger('sigiss.pool')
+
+# Limites de reciclagem (configuráveis por variável de ambiente)
+MAX_JOBS_POR_NAVEGADOR = int(os.getenv("SIGISS_POOL_MAX_JOBS", "50"))
+MAX_RSS_MB = int(os.getenv("SIGISS_POOL_MAX_RSS_MB", "1500"))
+
+
+def _pids_filhos():
+    """PIDs dos processos filhos diretos do processo atual"""
+    if psutil is None:
+        return set()
+    return {p.pid for p in psutil.Process().children()}
+
+
+class BrowserPool:
+    """Pool de navegadores Chromium mantidos abertos entre os jobs.
+
+    A API síncrona do Playwright só pode ser usada na thread que a criou, por
+    isso cada worker do servidor mantém o seu próprio navegador aquecido. Cada
+    job recebe um BrowserContext novo (cookies e storage isolados) e o
+    navegador é reciclado após `max_jobs` jobs ou quando o RSS dos processos
+    do Chromium passa de `max_rss_mb`.
+    """
+
+    def __init__(self, max_jobs=MAX_JOBS_POR_NAVEGADOR, max_rss_mb=MAX_RSS_MB, launch_options=None):
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.launch_options = launch_options or opcoes_lancamento()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._reciclagens = 0
+        self._bytes_economizados_estimados = 0
+
+    def _slot(self):
+        """Retorna (criando se preciso) o navegador da thread atual"""
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            # O driver é iniciado sob o lock para identificar o PID dele com segurança
+            with self._lock:
+                antes = _pids_filhos()
+                playwright = sync_playwright().start()
+                novos = _pids_filhos() - antes
+                slot = {
+                    'thread': threading.current_thread().name,
+                    'playwright': playwright,
+                    'pid_driver': novos.pop() if len(novos) == 1 else None,
+                    'browser': None,
+                    'jobs': 0,
+                    'em_uso': False,
+                    'iniciado_em': None,
+                }
+                self._slots[threading.get_ident()] = slot
+            self._local.slot = slot
+
+        if slot['browser'] is None or not slot['browser'].is_connected():
+            self._lancar(slot)
+        return slot
+
+    def _lancar(self, slot):
+        inicio = time.time()
+        slot['browser'] = slot['playwright'].chromium.launch(**self.launch_options)
+        slot['jobs'] = 0
+        slot['iniciado_em'] = time.time()
+        logger.info(f"Navegador iniciado para {slot['thread']} em {time.time() - inicio:.2f}s")
+
+    def _rss_mb(self, slot):
+        """RSS somado dos processos do Chromium pendurados no driver da thread"""
+        if psutil is None or not slot['pid_driver']:
+            return 0.0
+        try:
+            driver = psutil.Process(slot['pid_driver'])
+            total = sum(p.memory_info().rss for p in driver.children(recursive=True))
+        except psutil.Error:
+            return 0.0
+        return total / (1024 * 1024)
+
+    def _motivo_reciclagem(self, slot):
+        if slot['jobs'] >= self.max_jobs:
+            return f"{slot['jobs']} jobs executados"
+        rss = self._rss_mb(slot)
+        if rss > self.max_rss_mb:
+            return f"RSS de {rss:.0f} MB"
+        return None
+
+    def _reciclar(self, slot, motivo):
+        logger.info(f"Reciclando navegador de {slot['thread']}: {motivo}")
+        try:
+            slot['browser'].close()
+        except Exception as e:
+            logger.warning(f"Erro ao fechar navegador: {e}")
+        slot['browser'] = None
+        with self._lock:
+            self._reciclagens += 1
+
+        # Já deixa o próximo navegador aquecido para o próximo job
+        try:
+            self._lancar(slot)
+        except Exception as e:
+            logger.error(f"Erro ao reiniciar navegador: {e}")
+
+    @contextmanager
+    def contexto(self, **context_options):
+        """Entrega um BrowserContext novo no navegador aquecido da thread atual"""
+        slot = self._slot()
+        context, bloqueio = novo_contexto(slot['browser'], **context_options)
+        slot['em_uso'] = True
+        try:
+            yield context
+        finally:
+            slot['em_uso'] = False
+            slot['jobs'] += 1
+            if bloqueio:
+                registrar_economia(bloqueio)
+                with self._lock:
+                    self._bytes_economizados_estimados += bloqueio.bytes_economizados_estimados
+            try:
+                context.close()
+            except Exception as e:
+                logger.warning(f"Erro ao fechar contexto: {e}")
+
+            motivo = self._motivo_reciclagem(slot)
+            if motivo:
+                self._reciclar(slot, motivo)
+
+    def ocupacao(self):
+        """Resumo da ocupação do pool para monitoramento"""
+        with self._lock:
+            slots = list(self._slots.values())
+            reciclagens = self._reciclagens
+            bytes_economizados_estimados = self._bytes_economizados_estimados
+
+        navegadores = [
+            {
+                'thread': slot['thread'],
+                'ativo': slot['browser'] is not None,
+                'em_uso': slot['em_uso'],
+                'jobs': slot['jobs'],
+                'rss_mb': round(self._rss_mb(slot), 1),
+                'iniciado_em': slot['iniciado_em'],
+            }
+            for slot in slots
+        ]
+        em_uso = sum(1 for n in navegadores if n['em_uso'])
+        return {
+            'navegadores': len(navegadores),
+            'em_uso': em_uso,
+            'livres': len(navegadores) - em_uso,
+            'max_jobs_por_navegador': self.max_jobs,
+            'max_rss_mb': self.max_rss_mb,
+            'reciclagens': reciclagens,
+            'bytes_economizados_estimados': bytes_economizados_estimados,
+            'detalhes': navegadores,
+        }
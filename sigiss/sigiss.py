@@ -0,0 +1,87 @@
+import logging
+
+from sigiss.carteira import (
+    abrir_cliente, extrair_carteira, ir_para_carteira, pesquisar_cliente, sincronizar_carteira,
+)
+from sigiss.cronometro import Cronometro
+from sigiss.encerramento import encerrar_movimento, livros_do_modo
+from sigiss.login import CRC, SENHA, entrar
+
+logger = logging.getLogger('sigiss.sigiss')
+
+
+class SigissPage:
+    """Page object do portal SIGISS sobre uma página do Playwright.
+
+    Reúne os passos usados pelos bots (login, carteira, cliente e
+    encerramento) para que o servidor e o main.py executem um job dentro do
+    próprio processo, na página de um contexto do pool. Cada passo é
+    cronometrado (job_steps).
+    """
+
+    def __init__(self, page, livro='prestado', callback_status=None):
+        livros_do_modo(livro)  # valida o livro
+        self.page = page
+        self.livro = livro
+        self.callback_status = callback_status
+        self.cnpj = None
+        self.cronometro = Cronometro()
+
+    def _status(self, status):
+        if self.callback_status:
+            self.callback_status(status)
+
+    def login(self, crc=CRC, senha=SENHA):
+        """Entra na área do contador (reaproveita a sessão salva quando ainda vale)"""
+        self._status('iniciando_login')
+        with self.cronometro.passo('login') as passo:
+            reaproveitada = entrar(self.page, crc, senha, job=self.cnpj, cronometro=self.cronometro)
+            if reaproveitada:
+                passo['resultado'] = 'sessao_reaproveitada'
+        return reaproveitada
+
+    def go_to_carteira(self, esperar_linhas=True):
+        ir_para_carteira(self.page, esperar_linhas)
+
+    def extract_client_list(self):
+        """Linhas (im, cnpj, nome, omisso, debito) da carteira aberta"""
+        return extrair_carteira(self.page)
+
+    def sync_carteira(self, forcar=False):
+        """Sincroniza a carteira com o banco, respeitando o SIGISS_CARTEIRA_TTL"""
+        with self.cronometro.passo('carteira'):
+            return sincronizar_carteira(self.page, self.callback_status, forcar)
+
+    def search_client(self, cnpj):
+        pesquisar_cliente(self.page, cnpj)
+
+    def open_client(self, cnpj):
+        """Pesquisa o CNPJ na carteira aberta e entra na área do cliente"""
+        self.cnpj = self.cronometro.cnpj = cnpj
+        with self.cronometro.passo('abrir_cliente'):
+            abrir_cliente(self.page, cnpj)
+
+    def encerrar_movimento(self, periodos, livro=None):
+        """Encerra o cliente aberto nos períodos [(mes, ano), ...] (ou (MMAAAA, MMAAAA))"""
+        if self.cnpj is None:
+            raise RuntimeError("Nenhum cliente aberto: chame open_client antes de encerrar")
+        if not periodos:
+            raise ValueError("Nenhum período para encerrar")
+
+        if isinstance(periodos[0], str):
+            periodo_inicial, periodo_final = periodos
+        else:
+            periodo_inicial = ''.join(periodos[0])
+            periodo_final = ''.join(periodos[-1])
+
+        self._status('iniciando_encerramento')
+        return encerrar_movimento(self.page, self.cnpj, periodo_inicial, periodo_final,
+                                  livro or self.livro, self.callback_status, self.cronometro)
+
+    def encerrar_cliente(self, cnpj, periodo_inicial, periodo_final):
+        """Job completo: login, carteira, cliente e encerramento. Retorna o resumo"""
+        self.cnpj = self.cronometro.cnpj = cnpj
+        self.login()
+        self.sync_carteira()
+        self.open_client(cnpj)
+        return self.encerrar_movimento((periodo_inicial, periodo_final))
@@ -0,0 +1,487 @@
+"""Simulador local do portal SIGISS para testes de carga e latência sem o portal real.
+
+Reproduz as páginas e o frame #main que os bots usam: login do contador com
+captcha, Carteira de Clientes (com paginação), Movimento > Alterar, menu
+Encerramento, prestado.php/tomado.php com a confirmação de fechar e o
+Historico Emissões NF-e. Latência e falhas (erro 500, sessão expirada,
+captcha recusado) são injetadas conforme a configuração.
+
+Uso:
+    python simulador/portal.py [--porta 8085] [--latencia 150] [--jitter 100] [--erro 0.02]
+    SIGISS_BASE_URL=http://127.0.0.1:8085/acailandia/ python server.py
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from functools import wraps
+
+from flask import Flask, Response, jsonify, redirect, render_template_string, request, session
+from PIL import Image, ImageDraw, ImageFont
+
+# Permite importar o pacote sigiss quando o simulador roda como script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sigiss.captcha import TAMANHO_CAPTCHA, WHITELIST, captcha_valido
+from sigiss.login import LINK_CONTADOR, TITULO_PORTAL
+
+logger = logging.getLogger('simulador')
+
+PREFIXO = '/acailandia'
+LINHAS_POR_PAGINA = 50
+NOTAS_POR_PAGINA = 30
+MESES = [f"{m:02d}" for m in range(1, 13)]
+
+app = Flask(__name__)
+app.config['SECRET_KEY'] = 'simulador-sigiss'
+
+# Configuração (sobrescrita pela linha de comando)
+CONFIG = {
+    'latencia_ms': int(os.getenv("SIGISS_SIM_LATENCIA", "0")),
+    'jitter_ms': int(os.getenv("SIGISS_SIM_JITTER", "0")),
+    'taxa_erro': float(os.getenv("SIGISS_SIM_TAXA_ERRO", "0")),
+    'taxa_expiracao': float(os.getenv("SIGISS_SIM_TAXA_EXPIRACAO", "0")),
+    'taxa_falha_captcha': float(os.getenv("SIGISS_SIM_TAXA_FALHA_CAPTCHA", "0")),
+    'captcha': os.getenv("SIGISS_SIM_CAPTCHA", "livre"),  # 'livre' aceita qualquer texto válido, 'exato' exige o desenhado
+    'clientes': int(os.getenv("SIGISS_SIM_CLIENTES", "120")),
+    'sessao_ttl': int(os.getenv("SIGISS_SIM_SESSAO_TTL", "1800")),
+}
+
+# Estado compartilhado entre as sessões: competências encerradas e contadores
+_lock = threading.Lock()
+_encerrados = set()  # (cnpj, livro, 'MM/AAAA')
+_contadores = {}
+
+
+def contar(nome, n=1):
+    with _lock:
+        _contadores[nome] = _contadores.get(nome, 0) + n
+
+
+def cnpjs_sinteticos(n):
+    """CNPJs (14 dígitos) da carteira simulada, sempre os mesmos para o mesmo n"""
+    return [f"{i + 1:08d}0001{(i * 37) % 100:02d}" for i in range(n)]
+
+
+def carteira():
+    """Linhas (im, cnpj, nome, omisso, debito) da carteira simulada"""
+    return [
+        (f"{100000 + i}", cnpj, f"EMPRESA SIMULADA {i + 1:04d} LTDA", 'Não' if i % 7 else 'Sim', 'Não' if i % 11 else 'Sim')
+        for i, cnpj in enumerate(cnpjs_sinteticos(CONFIG['clientes']))
+    ]
+
+
+# ---------- Injeção de latência e falhas ----------
+
+@app.before_request
+def atrasar():
+    contar('requisicoes')
+    atraso = CONFIG['latencia_ms'] + random.uniform(0, CONFIG['jitter_ms'])
+    if atraso > 0:
+        time.sleep(atraso / 1000)
+
+
+def pagina_frame(view):
+    """Página carregada no #main: exige login e está sujeita às falhas injetadas"""
+    @wraps(view)
+    def envolvida(*args, **kwargs):
+        logado_em = session.get('logado_em')
+        if logado_em and random.random() < CONFIG['taxa_expiracao']:
+            contar('sessoes_expiradas')
+            logado_em = None
+            session.clear()
+        if not logado_em or time.time() - logado_em > CONFIG['sessao_ttl']:
+            # Como o portal: a sessão caiu e a janela inteira volta para o login
+            return render_template_string(SESSAO_EXPIRADA, prefixo=PREFIXO)
+        if random.random() < CONFIG['taxa_erro']:
+            contar('erros_injetados')
+            return render_template_string(ERRO_500), 500
+        return view(*args, **kwargs)
+    return envolvida
+
+
+# ---------- Templates ----------
+
+BASE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{{ titulo }}</title>
+<style>
+body { font-family: Arial, sans-serif; font-size: 13px; }
+.oculto { display: none; }
+table.bluecubeGrid { border-collapse: collapse; }
+table.bluecubeGrid td { border: 1px solid #ccc; padding: 2px 6px; }
+tr.line.selecionada td { background: #ffd; }
+#mensagem-erro { color: #c00; }
+#main { width: 100%; height: 600px; border: 0; }
+#modalNotas { position: absolute; top: 60px; left: 40px; background: #fff; border: 1px solid #333; padding: 10px; }
+</style></head><body>"""
+
+HOME = BASE + """
+<h1>Prefeitura Municipal de Açailândia</h1>
+<table>
+  <tr><td><a href="#">Acesso para contribuintes do município de Açailândia.</a></td></tr>
+  <tr><td><a href="{{ prefixo }}/login.php">{{ link_contador }}</a></td></tr>
+</table>
+</body></html>"""
+
+LOGIN = BASE + """
+<form method="post" action="{{ prefixo }}/login.php">
+  <input type="text" name="crc" placeholder="CRC do Contador" aria-label="CRC do Contador">
+  <input type="text" name="senha" placeholder="******" aria-label="******" style="-webkit-text-security: disc">
+  <div id="div-img-captcha" onclick="recarregarCaptcha()"><img src="{{ prefixo }}/captcha.php?n={{ n }}" alt="captcha"></div>
+  <input type="text" id="confirma" name="confirma" maxlength="4">
+  <button type="submit">  Login</button>
+  <div id="mensagem-erro">{{ erro }}</div>
+</form>
+<script>
+function recarregarCaptcha() {
+  document.querySelector('#div-img-captcha img').src = '{{ prefixo }}/captcha.php?n=' + Date.now();
+}
+</script>
+</body></html>"""
+
+AREA_CONTADOR = BASE + """
+<div id="menu">
+  <button type="button" onclick="document.getElementById('menuContribuinte').classList.remove('oculto')">Contribuinte</button>
+  <button type="button" onclick="abrirNoMain('movimento.php')">Movimento</button>
+  <button type="button" onclick="abrirNotas()">Historico Emissões NF-e</button>
+  <div id="menuContribuinte" class="oculto">
+    <a href="carteira.php" target="main" onclick="document.getElementById('menuContribuinte').classList.add('oculto')">Carteira de Clientes</a>
+  </div>
+</div>
+<div id="modalNotas" class="oculto">
+  <button type="button" aria-label="btnFechar" onclick="fecharNotas()">X</button>
+  <form id="formNotas" onsubmit="carregarNotas(1); return false;">
+    <select id="mesI">{% for m in meses %}<option value="{{ m }}">{{ m }}</option>{% endfor %}</select>
+    <input type="text" id="anoI">
+    <select id="mesF">{% for m in meses %}<option value="{{ m }}">{{ m }}</option>{% endfor %}</select>
+    <input type="text" id="anoF">
+    <input type="submit" value="Filtrar">
+  </form>
+  <div id="resultadoNotas"></div>
+</div>
+<iframe id="main" name="main" src="inicio.php"></iframe>
+<script>
+function abrirNoMain(url) { document.getElementById('main').contentWindow.location.href = url; }
+function abrirNotas() { document.getElementById('modalNotas').classList.remove('oculto'); }
+function fecharNotas() {
+  document.getElementById('modalNotas').classList.add('oculto');
+  document.getElementById('resultadoNotas').innerHTML = '';
+}
+function carregarNotas(pagina) {
+  const campos = ['mesI', 'anoI', 'mesF', 'anoF'].map(id => id + '=' + encodeURIComponent(document.getElementById(id).value));
+  fetch('notas.php?pagina=' + pagina + '&' + campos.join('&'))
+    .then(r => r.text())
+    .then(html => { document.getElementById('resultadoNotas').innerHTML = html; });
+}
+</script>
+</body></html>"""
+
+AVISO = BASE + """<p>{{ mensagem }}</p></body></html>"""
+
+CARTEIRA = BASE + """
+<h3>Carteira de Clientes</h3>
+<form method="get" action="carteira.php">
+  <input type="text" id="cnpj" name="cnpj" value="{{ filtro }}">
+  <button type="submit">Pesquisar</button>
+</form>
+<table class="bluecubeGrid">
+  {% for im, cnpj, nome, omisso, debito in linhas %}
+  <tr class="line" onclick="selecionar(this, '{{ cnpj }}')">
+    <td class="cell">{{ im }}</td><td class="cell center">{{ cnpj }}</td><td class="cell">{{ nome }}</td>
+    <td class="cell">{{ omisso }}</td><td class="cell">{{ debito }}</td>
+  </tr>
+  {% endfor %}
+</table>
+{% if proxima %}<a href="carteira.php?pagina={{ proxima }}&cnpj={{ filtro }}">Próxima</a>{% endif %}
+<form method="post" action="acessar.php">
+  <input type="hidden" id="selecionado" name="cnpj">
+  <button type="submit" name="btnAcessar">Acessar</button>
+</form>
+<script>
+function selecionar(linha, cnpj) {
+  document.querySelectorAll('tr.line').forEach(l => l.classList.remove('selecionada'));
+  linha.classList.add('selecionada');
+  document.getElementById('selecionado').value = cnpj;
+}
+</script>
+</body></html>"""
+
+CLIENTE = BASE + """<p>Contribuinte selecionado: <b>{{ cnpj }}</b></p></body></html>"""
+
+MOVIMENTO = BASE + """
+<p>Contribuinte: <b>{{ cnpj }}</b> &mdash; Competência: <b>{{ competencia }}</b></p>
+<button type="button" onclick="location.href='alterar.php'">Alterar</button>
+<table>
+  {% for livro, menu in menus %}
+  <tr><td class="textBold" onclick="document.getElementById('{{ menu }}').classList.remove('oculto')">Encerramento {{ livro }}</td></tr>
+  <tr><td><table id="{{ menu }}" class="oculto"><tr><td>
+    <a href="../fechamento/{{ livro }}.php">{% if encerrados[livro] %}Escrituração já foi Encerrada{% else %}Encerrar Escrituração{% endif %}</a>
+  </td></tr></table></td></tr>
+  {% endfor %}
+</table>
+</body></html>"""
+
+ALTERAR = BASE + """
+<form method="post" action="periodo.php">
+  <select name="mes">{% for m in meses %}<option value="{{ m }}">{{ m }}</option>{% endfor %}</select>
+  <input type="text" name="ano" value="">
+  <button type="submit">Ok</button>
+</form>
+</body></html>"""
+
+FECHAMENTO = BASE + """
+<p>Encerramento do livro de Serviços {{ 'Prestados' if livro == 'prestado' else 'Tomados' }} &mdash; {{ competencia }}</p>
+<form method="post" action="encerrar.php">
+  <input type="hidden" name="livro" value="{{ livro }}">
+  <button type="submit">{{ botao }}</button>
+</form>
+</body></html>"""
+
+ENCERRADO = BASE + """
+<p>Escrituração de {{ competencia }} encerrada com sucesso.</p>
+<span class="iconFechar" title="Fechar" onclick="if (confirm('Deseja fechar?')) { location.href='../contador/movimento.php'; }">&#10006;</span>
+</body></html>"""
+
+NOTAS = """
+<table class="bluecubeGrid">
+  {% for nota in notas %}
+  <tr class="line">{% for campo in nota %}<td class="cell">{{ campo }}</td>{% endfor %}</tr>
+  {% endfor %}
+</table>
+{% if proxima %}<a href="#" onclick="carregarNotas({{ proxima }}); return false;">Próxima</a>{% endif %}
+"""
+
+SESSAO_EXPIRADA = """<!DOCTYPE html><html><body>
+<script>top.location.href = '{{ prefixo }}/login.php';</script>
+Sessão expirada.</body></html>"""
+
+ERRO_500 = """<!DOCTYPE html><html><head><title>500</title></head><body>
+<h1>Internal Server Error</h1><p>Erro ao processar a requisição.</p></body></html>"""
+
+
+# ---------- Login ----------
+
+@app.route(f'{PREFIXO}/')
+@app.route(f'{PREFIXO}/index.php')
+def home():
+    return render_template_string(HOME, titulo=TITULO_PORTAL, prefixo=PREFIXO, link_contador=LINK_CONTADOR)
+
+
+@app.route(f'{PREFIXO}/login.php', methods=['GET'])
+def tela_login(erro=''):
+    return render_template_string(LOGIN, titulo=TITULO_PORTAL, prefixo=PREFIXO, erro=erro, n=time.time_ns())
+
+
+@app.route(f'{PREFIXO}/captcha.php')
+def captcha():
+    texto = ''.join(random.choice(WHITELIST) for _ in range(TAMANHO_CAPTCHA))
+    session['captcha'] = texto
+
+    imagem = Image.new('L', (120, 40), 235)
+    desenho = ImageDraw.Draw(imagem)
+    try:
+        fonte = ImageFont.load_default(size=26)
+    except TypeError:  # Pillow < 10.1
+        fonte = ImageFont.load_default()
+    desenho.text((12, 4), texto, fill=30, font=fonte)
+    for _ in range(60):
+        desenho.point((random.randrange(120), random.randrange(40)), fill=random.randrange(0, 120))
+
+    saida = io.BytesIO()
+    imagem.save(saida, format='PNG')
+    return Response(saida.getvalue(), mimetype='image/png', headers={'Cache-Control': 'no-store'})
+
+
+@app.route(f'{PREFIXO}/login.php', methods=['POST'])
+def login():
+    digitado = request.form.get('confirma', '')
+    esperado = session.pop('captcha', None)
+    if CONFIG['captcha'] == 'exato':
+        aceito = esperado is not None and digitado.lower() == esperado.lower()
+    else:
+        aceito = captcha_valido(digitado)
+    if aceito and random.random() < CONFIG['taxa_falha_captcha']:
+        aceito = False
+
+    if not aceito:
+        contar('captchas_recusados')
+        return tela_login('Código de confirmação incorreto.')
+
+    contar('logins')
+    session['logado_em'] = time.time()
+    session['crc'] = request.form.get('crc', '')
+    session.pop('cliente', None)
+    return redirect(f'{PREFIXO}/contador/index.php')
+
+
+# ---------- Área do contador ----------
+
+@app.route(f'{PREFIXO}/contador/index.php')
+def area_contador():
+    logado_em = session.get('logado_em')
+    if not logado_em or time.time() - logado_em > CONFIG['sessao_ttl']:
+        return redirect(f'{PREFIXO}/login.php')
+    return render_template_string(AREA_CONTADOR, titulo=TITULO_PORTAL, meses=MESES)
+
+
+@app.route(f'{PREFIXO}/contador/inicio.php')
+@pagina_frame
+def inicio():
+    return render_template_string(AVISO, titulo='Início', mensagem='Bem-vindo à área do contador.')
+
+
+@app.route(f'{PREFIXO}/contador/carteira.php')
+@pagina_frame
+def pagina_carteira():
+    filtro = request.args.get('cnpj', '').strip()
+    pagina = max(1, request.args.get('pagina', 1, type=int))
+    linhas = [linha for linha in carteira() if filtro in linha[1]]
+    inicio_pagina = (pagina - 1) * LINHAS_POR_PAGINA
+    proxima = pagina + 1 if inicio_pagina + LINHAS_POR_PAGINA < len(linhas) else None
+    return render_template_string(
+        CARTEIRA, titulo='Carteira de Clientes', filtro=filtro,
+        linhas=linhas[inicio_pagina:inicio_pagina + LINHAS_POR_PAGINA], proxima=proxima,
+    )
+
+
+@app.route(f'{PREFIXO}/contador/acessar.php', methods=['POST'])
+@pagina_frame
+def acessar():
+    cnpj = request.form.get('cnpj', '')
+    session['cliente'] = cnpj
+    session.pop('competencia', None)
+    return render_template_string(CLIENTE, titulo='Contribuinte', cnpj=cnpj)
+
+
+def competencia_atual():
+    hoje = time.localtime()
+    return session.get('competencia', f"{hoje.tm_mon:02d}/{hoje.tm_year}")
+
+
+@app.route(f'{PREFIXO}/contador/movimento.php')
+@pagina_frame
+def movimento():
+    cnpj = session.get('cliente')
+    if not cnpj:
+        return render_template_string(AVISO, titulo='Movimento', mensagem='Selecione um contribuinte.')
+    competencia = competencia_atual()
+    with _lock:
+        encerrados = {livro: (cnpj, livro, competencia) in _encerrados for livro in ('prestado', 'tomado')}
+    return render_template_string(
+        MOVIMENTO, titulo='Movimento', cnpj=cnpj, competencia=competencia, encerrados=encerrados,
+        menus=[('prestado', 'tableEncerra_p'), ('tomado', 'tableEncerra_t')],
+    )
+
+
+@app.route(f'{PREFIXO}/contador/alterar.php')
+@pagina_frame
+def alterar():
+    return render_template_string(ALTERAR, titulo='Alterar Competência', meses=MESES)
+
+
+@app.route(f'{PREFIXO}/contador/periodo.php', methods=['POST'])
+@pagina_frame
+def periodo():
+    session['competencia'] = f"{request.form.get('mes', '01')}/{request.form.get('ano', '')}"
+    return redirect(f'{PREFIXO}/contador/movimento.php')
+
+
+@app.route(f'{PREFIXO}/contador/notas.php')
+@pagina_frame
+def notas():
+    pagina = max(1, request.args.get('pagina', 1, type=int))
+    competencia = f"{request.args.get('mesI', '01')}/{request.args.get('anoI', '')}"
+    # Notas determinísticas por contribuinte e competência
+    sorteio = random.Random(f"{session.get('cliente', '')}{competencia}")
+    todas = []
+    for i in range(sorteio.randint(1, 80)):
+        valor = f"{sorteio.uniform(50, 20000):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+        todas.append((
+            f"{i + 1:06d}", f"15/{competencia}", competencia, 'Tributada no município', 'Serviço simulado',
+            valor, f"TOMADOR {sorteio.randint(1, 999):03d}", 'Normal', '',
+        ))
+    inicio_pagina = (pagina - 1) * NOTAS_POR_PAGINA
+    proxima = pagina + 1 if inicio_pagina + NOTAS_POR_PAGINA < len(todas) else None
+    return render_template_string(NOTAS, notas=todas[inicio_pagina:inicio_pagina + NOTAS_POR_PAGINA], proxima=proxima)
+
+
+# ---------- Fechamento ----------
+
+BOTOES = {'prestado': 'Encerrar Mês.', 'tomado': 'Encerrar Mês'}
+
+
+@app.route(f'{PREFIXO}/fechamento/<livro>.php')
+@pagina_frame
+def fechamento(livro):
+    if livro not in BOTOES:
+        return 'Página não encontrada', 404
+    return render_template_string(FECHAMENTO, titulo='Encerramento', livro=livro,
+                                  competencia=competencia_atual(), botao=BOTOES[livro])
+
+
+@app.route(f'{PREFIXO}/fechamento/encerrar.php', methods=['POST'])
+@pagina_frame
+def encerrar():
+    livro = request.form.get('livro')
+    competencia = competencia_atual()
+    with _lock:
+        _encerrados.add((session.get('cliente'), livro, competencia))
+    contar('encerramentos')
+    return render_template_string(ENCERRADO, titulo='Encerramento', competencia=competencia)
+
+
+# ---------- Controle do simulador ----------
+
+@app.route('/simulador/estatisticas')
+def estatisticas():
+    with _lock:
+        return jsonify(dict(_contadores, competencias_encerradas=len(_encerrados), config=CONFIG))
+
+
+@app.route('/simulador/clientes')
+def clientes():
+    return jsonify(cnpjs_sinteticos(CONFIG['clientes']))
+
+
+@app.route('/simulador/reiniciar', methods=['POST'])
+def reiniciar():
+    """Zera competências encerradas e contadores; aceita novos valores de configuração no JSON"""
+    dados = request.get_json(silent=True) or {}
+    with _lock:
+        _encerrados.clear()
+        _contadores.clear()
+        CONFIG.update({k: type(CONFIG[k])(v) for k, v in dados.items() if k in CONFIG})
+    return jsonify(CONFIG)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador local do portal SIGISS")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8085)
+    parser.add_argument('--latencia', type=int, default=CONFIG['latencia_ms'], help="Latência base por requisição (ms)")
+    parser.add_argument('--jitter', type=int, default=CONFIG['jitter_ms'], help="Latência extra aleatória (0..ms)")
+    parser.add_argument('--erro', type=float, default=CONFIG['taxa_erro'], help="Probabilidade de erro 500 nas páginas do #main")
+    parser.add_argument('--expirar', type=float, default=CONFIG['taxa_expiracao'], help="Probabilidade de a sessão cair a cada página")
+    parser.add_argument('--falha-captcha', type=float, default=CONFIG['taxa_falha_captcha'], help="Probabilidade de recusar um captcha correto")
+    parser.add_argument('--captcha', choices=['livre', 'exato'], default=CONFIG['captcha'])
+    parser.add_argument('--clientes', type=int, default=CONFIG['clientes'], help="Tamanho da carteira simulada")
+    args = parser.parse_args()
+
+    CONFIG.update({
+        'latencia_ms': args.latencia,
+        'jitter_ms': args.jitter,
+        'taxa_erro': args.erro,
+        'taxa_expiracao': args.expirar,
+        'taxa_falha_captcha': args.falha_captcha,
+        'captcha': args.captcha,
+        'clientes': args.clientes,
+    })
+    print(f"🧪 Simulador SIGISS em http://{args.host}:{args.porta}{PREFIXO}/ (SIGISS_BASE_URL)")
+    app.run(host=args.host, port=args.porta, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from playwright.sync_api import sync_playwright
 
+import os
 import time
 import pytesseract
 from PIL import Image
@@ -29,10 +30,10 @@ with sync_playwright() as p:
 
         # Espera a imagem aparecer e capturar
         captcha_element = page.query_selector('div#div-img-captcha img')
-        captcha_element.screenshot(path="captcha.png")
+        png = captcha_element.screenshot()
 
-        # abre a imagem e converte para preto e branco e aumenta o tamanho para o ocr
-        img = Image.open("captcha.png")
+        # abre a imagem em memória e converte para preto e branco para o ocr
+        img = Image.open(BytesIO(png))
         img = img.convert('L')
         img = img.point(lambda x: 0 if x < 140 else 255, '1')
 
@@ -69,7 +70,9 @@ with sync_playwright() as p:
                 sucesso = True
                 break
         else:
-            img.save(f"captcha_tentativa_{tentativas}.png")
+            if os.getenv("SIGISS_AMOSTRAS_CAPTCHA"):
+                with open(os.path.join(os.getenv("SIGISS_AMOSTRAS_CAPTCHA"), f"captcha_tentativa_{tentativas}.png"), 'wb') as f:
+                    f.write(png)
             print("OCR inválido, atualizando captcha para tentar de novo...")
             page.click("#div-img-captcha")  # atualiza a imagem clicando
             page.wait_for_timeout(1000)  # espera recarregar